@@ -0,0 +1,191 @@
+__author__ = 'Yury A. Kolotovichev'
+
+import logging
+import threading
+from time import time
+from Influxdb.measurements import Measurement, Point
+
+
+AGGREGATES = ('mean', 'min', 'max', 'last', 'count')
+
+
+class _Window:
+    """
+    Running aggregates of the fields of a series within a window
+    """
+
+    __slots__ = ('fields', 'last_timestamp')
+
+    def __init__(self):
+        self.fields = {}  # field -> [sum, count, min, max, last]
+        self.last_timestamp = None
+
+    def add(self, fields, timestamp):
+        latest = self.last_timestamp is None or timestamp >= self.last_timestamp
+        if latest:
+            self.last_timestamp = timestamp
+        for key, value in fields.items():
+            state = self.fields.get(key)
+            numeric = isinstance(value, (int, float)) and not isinstance(value, bool)
+            if state is None:
+                self.fields[key] = [value if numeric else None, 1, value, value, value]
+                continue
+            state[1] += 1
+            if numeric and state[0] is not None:
+                state[0] += value
+                if value < state[2]:
+                    state[2] = value
+                if value > state[3]:
+                    state[3] = value
+            if latest:
+                state[4] = value
+
+
+class WindowAggregator:
+    """
+    Write path stage: raw points are aggregated per series over fixed time windows, only aggregates
+    are passed to the sink (BatchWriter or another stage with append/flush/close).
+    Aggregated field is named as the server names it: <aggregate>_<field> (mean_X, max_X, ...).
+    Min, max and mean are computed for numeric fields only.
+
+    Windows are closed by point timestamps, never by the wall clock, so historical data is aggregated
+    as well as live data. A window of a series is emitted once a point of the same series newer than
+    the window end plus allowed_lateness arrives. Points of already emitted windows are dropped and
+    counted in late. Open windows are emitted on close
+    """
+
+    def __init__(self, sink, window=10.0, aggregates=AGGREGATES, allowed_lateness=10.0, time_precision='n'):
+        """
+        :param sink: object with append(*points) receiving aggregated points, e.g. BatchWriter
+        :param window: window length (seconds)
+        :param aggregates: aggregates to emit, subset of AGGREGATES
+        :param allowed_lateness: time a window waits for late points of its series after its end (seconds)
+        :param time_precision: precision of point timestamps (n, u, ms, s, m, h)
+        :return:
+        """
+
+        unknown = set(aggregates) - set(AGGREGATES)
+        if unknown:
+            raise ValueError('Unknown aggregates %s. Expected some of %s' % (sorted(unknown), str(AGGREGATES)))
+
+        self.sink = sink
+        self.aggregates = aggregates
+        self.time_precision = time_precision
+        multiplier = Measurement.precision_multipliers[time_precision]
+        self.window = int(window * 10**9) // multiplier
+        self.lateness = int(allowed_lateness * 10**9) // multiplier
+        self._unit = multiplier
+
+        self.series = {}  # (name, sorted tag items) -> {window start: _Window}
+        self.watermarks = {}  # series key -> newest timestamp seen
+        self.points = 0
+        self.emitted = 0
+        self.late = 0
+        self._closed_until = {}  # series key -> windows ending not later than this are emitted
+        self._lock = threading.Lock()
+
+    def append(self, *measurements):
+        """
+        Aggregates Measurement-like points (with name, tags, fields and timestamp)
+        """
+
+        with self._lock:
+            touched = set()
+            for measurement in measurements:
+                timestamp = measurement.timestamp or int(time() * 10**9) // self._unit
+                start = timestamp - timestamp % self.window
+                tags = measurement.tags
+                key = (measurement.name, tuple(sorted(tags.items())) if tags else ())
+                if start + self.window <= self._closed_until.get(key, float('-inf')):
+                    self.late += 1
+                    continue
+
+                windows = self.series.get(key)
+                if windows is None:
+                    windows = self.series[key] = {}
+                window = windows.get(start)
+                if window is None:
+                    window = windows[start] = _Window()
+                window.add(measurement.fields, timestamp)
+                self.points += 1
+                if timestamp > self.watermarks.get(key, float('-inf')):
+                    self.watermarks[key] = timestamp
+                touched.add(key)
+
+            closed = []
+            for key in touched:
+                # windows can only be closed when the watermark of the series crosses a window boundary
+                until = self.watermarks[key] - self.lateness
+                until -= until % self.window
+                if until > self._closed_until.get(key, float('-inf')):
+                    self._closed_until[key] = until
+                    closed.extend(self._close(key, until))
+            closed.sort(key=lambda item: item[0])
+        self._emit(closed)
+
+    def _close(self, key, until=None):
+        """
+        Removes windows of a series ending not later than until (all windows if until is None)
+        :return: list of (window start, series key, _Window)
+        """
+
+        windows = self.series[key]
+        closed = [(start, key, windows.pop(start)) for start in sorted(windows)
+                  if until is None or start + self.window <= until]
+        if not windows:
+            del self.series[key]
+        return closed
+
+    def _emit(self, closed):
+        if not closed:
+            return
+        points = []
+        for start, (name, tag_items), window in closed:
+            fields = {}
+            for field, (total, count, minimum, maximum, last) in window.fields.items():
+                for aggregate in self.aggregates:
+                    if aggregate == 'count':
+                        fields['count_' + field] = count
+                    elif aggregate == 'last':
+                        fields['last_' + field] = last
+                    elif total is not None:
+                        fields[aggregate + '_' + field] = (total / count if aggregate == 'mean' else
+                                                           minimum if aggregate == 'min' else maximum)
+            points.append(Point(name, fields, dict(tag_items) if tag_items else None, start))
+        self.sink.append(*points)
+        self.emitted += len(points)
+        logging.debug('WindowAggregator: %d aggregated points emitted' % len(points))
+
+    def flush(self):
+        """
+        Flushes the sink. Open windows are not emitted: they are closed by newer points or on close
+        """
+
+        if hasattr(self.sink, 'flush'):
+            self.sink.flush()
+
+    def close(self):
+        """
+        Emits all open windows, then closes the sink
+        """
+
+        with self._lock:
+            closed = []
+            for key in list(self.series):
+                closed.extend(self._close(key))
+            closed.sort(key=lambda item: item[0])
+        self._emit(closed)
+        if self.late:
+            logging.warning('WindowAggregator: %d late points dropped' % self.late)
+        if hasattr(self.sink, 'close'):
+            self.sink.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def __repr__(self):
+        return 'WindowAggregator: %d points in, %d aggregates out, %d late points dropped' % (
+            self.points, self.emitted, self.late)
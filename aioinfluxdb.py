@@ -0,0 +1,168 @@
+__author__ = 'Yury A. Kolotovichev'
+
+import asyncio
+import json
+import logging
+import aiohttp
+from Influxdb.exceptions import InfluxdbAPICodeMismatchError, InfluxdbAPIRequestError
+
+
+class AsyncResponse:
+    """
+    Fully read HTTP response returned by AsyncInfluxDBClient
+    """
+
+    def __init__(self, status_code, content, headers):
+        self.status_code = status_code
+        self.content = content
+        self.headers = headers
+
+    @property
+    def text(self):
+        return self.content.decode('utf-8', errors='replace')
+
+    def json(self):
+        return json.loads(self.content)
+
+    def __repr__(self):
+        return '<AsyncResponse [%d]>' % self.status_code
+
+
+class AsyncInfluxDBClient:
+    """
+    asyncio counterpart of InfluxDBClient. Any number of coroutines may share one client:
+    requests are multiplexed over a bounded pool of keep-alive connections
+    """
+
+    def __init__(self, host, port, user=None, password=None, http_timeout=50, pool_size=100):
+        """
+        :param pool_size: maximum number of simultaneously open connections (requests in flight)
+        """
+        self.host = host
+        self.port = port
+        self.user = user
+        self.password = password
+        self.http_timeout = http_timeout
+        self.pool_size = pool_size
+        self.base_url = 'http://%s:%s' % (host, port)
+
+        self.HTTPsession = None
+
+    def _session(self):
+        # session has to be created inside a running event loop
+        if self.HTTPsession is None or self.HTTPsession.closed:
+            connector = aiohttp.TCPConnector(limit=self.pool_size, limit_per_host=self.pool_size)
+            self.HTTPsession = aiohttp.ClientSession(connector=connector,
+                                                     timeout=aiohttp.ClientTimeout(total=self.http_timeout))
+        return self.HTTPsession
+
+    async def _request(self, url, method, expected_response_codes, headers=None, params=None, data=None):
+        """Make a HTTP request"""
+
+        if params:
+            params = {k: v for k, v in params.items() if v is not None}
+
+        try:
+            async with self._session().request(method, url, headers=headers, params=params, data=data) as r:
+                r = AsyncResponse(r.status, await r.read(), r.headers)
+        except (aiohttp.ClientError, asyncio.TimeoutError) as err:
+            raise InfluxdbAPIRequestError(str(err))
+
+        if r.status_code in expected_response_codes:
+            logging.debug('HTTP request completed with expected code %d. %s' % (r.status_code, r.text))
+            return r
+        else:
+            raise InfluxdbAPICodeMismatchError(r.text, r.status_code, expected_response_codes)
+
+    async def create_database(self, dbname):
+        url = '%s/%s' % (self.base_url, 'query')
+        params = {'q': 'CREATE DATABASE %s' % dbname, 'u': self.user, 'p': self.password}
+
+        await self._request(url=url, method='GET', params=params, expected_response_codes=(200, ))
+        logging.info('Database <%s> created or already exists' % dbname)
+
+        return True
+
+    async def drop_database(self, dbname):
+        url = '%s/%s' % (self.base_url, 'query')
+        params = {'q': 'DROP DATABASE %s' % dbname, 'u': self.user, 'p': self.password}
+
+        await self._request(url=url, method='GET', params=params, expected_response_codes=(200, ))
+        logging.info('Database <%s> dropped' % dbname)
+
+        return True
+
+    async def write(self, dbname, points, retention_policy=None, precision=None, consistency=None, gzipped=False):
+        """
+        :param points: line protocol bytes (Measurement.to_bytes, Container.dump, DummyPoints.dump)
+                       or an iterable of such chunks
+        """
+
+        url = '%s/%s' % (self.base_url, 'write')
+        headers = {}
+        params = {'db': dbname, 'u': self.user, 'p': self.password,
+                  'rp': retention_policy, 'precision': precision, 'consistency': consistency}
+
+        if gzipped:  # request body gzipped
+                headers = {'Content-encoding': 'gzip'}
+
+        if not isinstance(points, (bytes, bytearray, memoryview)):
+            points = b''.join(points)
+
+        r = await self._request(url=url,
+                                method='POST',
+                                params=params,
+                                data=bytes(points),
+                                headers=headers,
+                                expected_response_codes=(204, 500))
+        logging.info('Code %d: %s. Points added to database' % (r.status_code, r.text))
+
+        return r
+
+    async def query(self, dbname, query):
+        url = '%s/%s' % (self.base_url, 'query')
+        params = {'db': dbname, 'q': query, 'u': self.user, 'p': self.password}
+
+        r = await self._request(url=url, method='GET', params=params, expected_response_codes=(200, ))
+        logging.info('Code %d: %s. Data queried.' % (r.status_code, r.text))
+        return r.json()
+
+    async def close(self):
+        if self.HTTPsession is not None:
+            await self.HTTPsession.close()
+            self.HTTPsession = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.close()
+
+    def __repr__(self):
+        return 'AsyncInfluxDBClient: %s' % self.base_url
+
+
+
+if __name__ == '__main__':
+
+    from measurements import DummyPoints
+
+    logging.basicConfig(format='%(levelname)-8s [%(asctime)s]  %(message)s',
+                        level=logging.INFO)
+
+    host = '10.6.74.70'
+    port = 8086
+    dbname = 'unittestdb'
+
+    async def main():
+        async with AsyncInfluxDBClient(host=host, port=port, http_timeout=10, pool_size=20) as dbclient:
+            await dbclient.create_database(dbname)
+
+            # 100 chunks in flight over 20 connections
+            chunks = [DummyPoints('Tilt', npoints=1000, decimals=4).dump() for _ in range(100)]
+            await asyncio.gather(*[dbclient.write(dbname=dbname, points=chunk, precision='n') for chunk in chunks])
+
+            print(await dbclient.query(dbname=dbname, query='SELECT count(X) FROM /Tilt_*/'))
+            await dbclient.drop_database(dbname)
+
+    asyncio.run(main())
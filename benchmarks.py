@@ -0,0 +1,295 @@
+__author__ = 'Yury A. Kolotovichev'
+
+import gzip
+import json
+import logging
+import platform
+import tracemalloc
+from random import Random
+from datetime import datetime
+from time import perf_counter
+from Influxdb.influxdb import InfluxDBClient
+from Influxdb.measurements import Measurement, Container, Series, encode_columns, np
+from Influxdb.writer import BatchWriter
+from Influxdb.fakeserver import FakeInfluxDBServer
+
+
+def make_dataset(npoints, nseries=100, seed=0):
+    """
+    Deterministic Tilt-like dataset
+    :return: list of (name, tags, fields, timestamp)
+    """
+
+    rng = Random(seed)
+    start = 1388399803567000000
+    return [('Tilt', {'sensor': 'Tilt_%d' % (i % nseries)},
+             {'X': rng.random() * -720.0, 'Y': rng.random() * 720.0, 'T': rng.random() * 30.0},
+             start + (i // nseries) * 10**9)
+            for i in range(npoints)]
+
+
+class WriteMode:
+    """
+    Benchmarked write path. encode turns a batch of dataset rows into a payload, send writes it.
+    Streaming modes encode lazily while sending, their encode time is measured by a dry run
+    """
+
+    name = None
+    streaming = False
+    decimals = 4
+
+    def prepare(self, batches):
+        """Input conversion which is not part of the benchmarked path"""
+
+    def setup(self, client, dbname):
+        pass
+
+    def encode(self, batch):
+        raise NotImplementedError
+
+    def send(self, client, dbname, payload):
+        client.write(dbname=dbname, points=payload, precision='n')
+
+    def teardown(self):
+        pass
+
+
+class ContainerMode(WriteMode):
+    name = 'container'
+
+    def encode(self, batch):
+        return Container(*[Measurement(name, fields, tags, timestamp) for name, tags, fields, timestamp in batch]) \
+            .dump(decimals=self.decimals)
+
+
+class PointMode(WriteMode):
+    name = 'point'
+
+    def setup(self, client, dbname):
+        self.series = {}
+
+    def encode(self, batch):
+        lines = []
+        for name, tags, fields, timestamp in batch:
+            key = (name, tags['sensor'])
+            series = self.series.get(key)
+            if series is None:
+                series = self.series[key] = Series(name, tags)
+            lines.append(series.point(fields, timestamp).to_bytes(decimals=self.decimals))
+        return b''.join(lines)
+
+
+class ColumnsMode(WriteMode):
+    name = 'encode_columns'
+
+    def prepare(self, batches):
+        # columns are how such data arrives (NumPy/pandas), building them is not part of encoding
+        self.columns = {}
+        for batch in batches:
+            fields = {field: np.array([row[2][field] for row in batch]) for field in ('X', 'Y', 'T')}
+            self.columns[id(batch)] = (np.array([row[3] for row in batch], dtype=np.int64),
+                                       np.array([row[1]['sensor'] for row in batch]),
+                                       fields)
+
+    def encode(self, batch):
+        timestamps, sensors, fields = self.columns[id(batch)]
+        return encode_columns('Tilt', fields, timestamps, tags={'sensor': sensors}, decimals=self.decimals)
+
+
+class GzippedMode(WriteMode):
+    name = 'gzipped'
+
+    def encode(self, batch):
+        return gzip.compress(ContainerMode.encode(self, batch))
+
+    def send(self, client, dbname, payload):
+        client.write(dbname=dbname, points=payload, precision='n', gzipped=True)
+
+
+class GeneratorMode(WriteMode):
+    name = 'generator'
+    streaming = True
+
+    def encode(self, batch):
+        return (Measurement(name, fields, tags, timestamp).to_bytes(decimals=self.decimals)
+                for name, tags, fields, timestamp in batch)
+
+
+class CompressMode(GeneratorMode):
+    name = 'compress'
+
+    def send(self, client, dbname, payload):
+        client.write(dbname=dbname, points=payload, precision='n', compress=True)
+
+
+class BatchWriterMode(WriteMode):
+    name = 'batch_writer'
+    streaming = True
+
+    def setup(self, client, dbname):
+        self.writer = None
+        self.client = client
+        self.dbname = dbname
+
+    def encode(self, batch):
+        points = [Measurement(name, fields, tags, timestamp) for name, tags, fields, timestamp in batch]
+        for point in points:  # lazy: yields line protocol on dry runs
+            yield point
+
+    def send(self, client, dbname, payload):
+        if self.writer is None:
+            self.writer = BatchWriter(client, dbname, batch_size=10**9, max_age=None, decimals=self.decimals)
+        self.writer.append(*payload)
+        self.writer.flush()
+
+    def teardown(self):
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = None
+
+
+MODES = [ContainerMode, PointMode, ColumnsMode, GzippedMode, GeneratorMode, CompressMode, BatchWriterMode]
+
+
+def _run_mode(mode, client, server, dbname, batches):
+    server.reset()
+    mode.setup(client, dbname)
+    encode_seconds = 0.0
+    network_seconds = 0.0
+    for batch in batches:
+        started = perf_counter()
+        payload = mode.encode(batch)
+        encoded = perf_counter()
+        mode.send(client, dbname, payload)
+        encode_seconds += encoded - started
+        network_seconds += perf_counter() - encoded
+    mode.teardown()
+
+    if mode.streaming:  # encoding happened while sending
+        mode.setup(client, dbname)
+        started = perf_counter()
+        for batch in batches:
+            for line in mode.encode(batch):
+                if not isinstance(line, bytes):
+                    line.to_bytes(decimals=mode.decimals)
+        dry_run = perf_counter() - started
+        mode.teardown()
+        encode_seconds += dry_run
+        network_seconds = max(0.0, network_seconds - dry_run)
+
+    return encode_seconds, network_seconds, server.points, server.bytes
+
+
+def run(npoints=100000, batch_size=5000, nseries=100, repeat=3, modes=None, seed=0, transport='requests'):
+    """
+    Runs write benchmarks against FakeInfluxDBServer
+    :param modes: names of modes to run (all by default)
+    :param transport: HTTP transport of the client ('requests' or 'http.client')
+    :param repeat: every mode is run repeat times, the fastest run is reported
+    :return: results dict (JSON serializable)
+    """
+
+    dataset = make_dataset(npoints, nseries=nseries, seed=seed)
+    batches = [dataset[i:i + batch_size] for i in range(0, npoints, batch_size)]
+    dbname = 'benchmarkdb'
+
+    results = {'created': datetime.now().isoformat(), 'python': platform.python_version(),
+               'platform': platform.platform(), 'npoints': npoints, 'batch_size': batch_size, 'nseries': nseries,
+               'repeat': repeat, 'transport': transport, 'modes': {}}
+
+    with FakeInfluxDBServer() as server:
+        client = InfluxDBClient(host=server.host, port=server.port, http_retries=0, transport=transport)
+        for mode_class in MODES:
+            mode = mode_class()
+            if modes and mode.name not in modes:
+                continue
+            if mode_class is ColumnsMode and np is None:
+                logging.warning('numpy is not installed, <%s> skipped' % mode.name)
+                continue
+
+            mode.prepare(batches)
+            runs = [_run_mode(mode, client, server, dbname, batches) for _ in range(repeat)]
+            encode_seconds, network_seconds, points, nbytes = min(runs, key=lambda r: r[0] + r[1])
+
+            # peak memory is measured in a separate run, tracing slows everything down
+            tracemalloc.start()
+            _run_mode(mode, client, server, dbname, batches)
+            peak_memory = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+
+            seconds = encode_seconds + network_seconds
+            results['modes'][mode.name] = {
+                'points': points, 'bytes': nbytes, 'seconds': seconds,
+                'encode_seconds': encode_seconds, 'network_seconds': network_seconds,
+                'points_per_second': points / seconds if seconds else 0.0,
+                'bytes_per_second': nbytes / seconds if seconds else 0.0,
+                'peak_memory_bytes': peak_memory}
+            if points != npoints:
+                logging.error('Mode <%s>: server received %d points of %d' % (mode.name, points, npoints))
+            logging.info('%-15s %10.0f points/sec, encode %.3f s, network %.3f s, peak memory %.1f MB' %
+                         (mode.name, points / seconds if seconds else 0.0, encode_seconds, network_seconds,
+                          peak_memory / 2**20))
+    return results
+
+
+def compare(baseline, results, tolerance=0.1):
+    """
+    :param baseline: results of a previous run
+    :param tolerance: relative slowdown (or memory growth) tolerated
+    :return: list of regression descriptions
+    """
+
+    regressions = []
+    for name, current in results['modes'].items():
+        previous = baseline['modes'].get(name)
+        if previous is None:
+            continue
+        if current['points_per_second'] < previous['points_per_second'] * (1 - tolerance):
+            regressions.append('%s: %.0f points/sec, was %.0f' % (name, current['points_per_second'],
+                                                                 previous['points_per_second']))
+        if current['peak_memory_bytes'] > previous['peak_memory_bytes'] * (1 + tolerance):
+            regressions.append('%s: peak memory %d bytes, was %d' % (name, current['peak_memory_bytes'],
+                                                                    previous['peak_memory_bytes']))
+    return regressions
+
+
+
+if __name__ == '__main__':
+
+    import argparse
+    import sys
+
+    parser = argparse.ArgumentParser(description='Write path benchmarks against an in-process fake InfluxDB')
+    parser.add_argument('--points', type=int, default=100000)
+    parser.add_argument('--batch-size', type=int, default=5000)
+    parser.add_argument('--series', type=int, default=100)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--modes', nargs='*', help='modes to run: %s' % ', '.join(m.name for m in MODES))
+    parser.add_argument('--output', default='benchmarks.json', help='results JSON file')
+    parser.add_argument('--baseline', help='results JSON of a previous run to compare with')
+    parser.add_argument('--tolerance', type=float, default=0.1)
+    parser.add_argument('--transport', default='requests', choices=('requests', 'http.client'))
+    args = parser.parse_args()
+
+    logging.basicConfig(format='%(levelname)-8s [%(asctime)s]  %(message)s',
+                        level=logging.WARNING)
+
+    results = run(npoints=args.points, batch_size=args.batch_size, nseries=args.series, repeat=args.repeat,
+                  modes=args.modes, transport=args.transport)
+    print('%-15s %12s %12s %10s %10s %10s' % ('mode', 'points/sec', 'MB/sec', 'encode, s', 'network, s',
+                                             'peak, MB'))
+    for name, result in results['modes'].items():
+        print('%-15s %12.0f %12.2f %10.3f %10.3f %10.1f' % (name, result['points_per_second'],
+                                                           result['bytes_per_second'] / 2**20,
+                                                           result['encode_seconds'], result['network_seconds'],
+                                                           result['peak_memory_bytes'] / 2**20))
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print('Results saved to %s' % args.output)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(json.load(f), results, tolerance=args.tolerance)
+        for regression in regressions:
+            print('REGRESSION %s' % regression)
+        sys.exit(1 if regressions else 0)
@@ -0,0 +1,180 @@
+__author__ = 'Yury A. Kolotovichev'
+
+import gzip
+import logging
+import threading
+from time import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, wait, FIRST_COMPLETED
+from Influxdb.influxdb import InfluxDBClient
+from Influxdb.exceptions import InfluxdbAPICodeMismatchError, InfluxdbAPIRequestError
+
+
+# per-worker state: every worker process/thread owns its InfluxDBClient session
+_worker = threading.local()
+
+
+def _write_chunk(client_kwargs, index, first_line, npoints, chunk, write_kwargs):
+    """
+    Sends a single chunk with the worker's own client
+    :param client_kwargs: InfluxDBClient settings of the loader, passed with every chunk, so loaders
+                          running at the same time don't share them
+    :return: (index, first_line, npoints, nbytes, seconds, error message or None)
+    """
+
+    client = getattr(_worker, 'client', None)
+    if client is None or _worker.client_kwargs != client_kwargs:
+        client = _worker.client = InfluxDBClient(**client_kwargs)
+        _worker.client_kwargs = client_kwargs
+
+    start = time()
+    try:
+        r = client.write(points=chunk, **write_kwargs)
+        # InfluxDBClient.write returns 500 (points not written to all peers) instead of raising
+        if r.status_code >= 500:
+            raise InfluxdbAPICodeMismatchError(r.text, r.status_code, (204, ))
+        error = None
+    except (InfluxdbAPIRequestError, InfluxdbAPICodeMismatchError) as err:
+        error = '%s: %s' % (type(err).__name__, err)
+    return index, first_line, npoints, len(chunk), time() - start, error
+
+
+def iter_chunks(source, chunk_size):
+    """
+    Splits line protocol into chunks of chunk_size lines
+    :param source: file name (.gz files are decompressed), binary file object
+                   or iterable of line protocol bytes (one or several lines per item)/Measurement objects
+    :return: generator of (first_line, npoints, chunk bytes)
+    """
+
+    if isinstance(source, str):
+        opener = gzip.open if source.endswith('.gz') else open
+        with opener(source, 'rb') as f:
+            yield from iter_chunks(f, chunk_size)
+        return
+
+    lines = []
+    first_line = 0
+    for item in source:
+        if not isinstance(item, (bytes, bytearray)):
+            item = item.to_bytes()
+        # an item may hold several lines (DummyPoints 'chunks', Container.dump), so it is split on newlines
+        for line in item.split(b'\n'):
+            if not line.strip():
+                continue
+            lines.append(line + b'\n')
+            if len(lines) == chunk_size:
+                yield first_line, len(lines), b''.join(lines)
+                first_line += len(lines)
+                lines = []
+    if lines:
+        yield first_line, len(lines), b''.join(lines)
+
+
+class BulkLoadReport:
+    """
+    Aggregate result of BulkLoader.load
+    """
+
+    def __init__(self):
+        self.points = 0
+        self.bytes = 0
+        self.chunks = 0
+        self.seconds = 0.0
+        self.failures = []  # (chunk index, first line number, npoints, error message)
+
+    @property
+    def failed_points(self):
+        return sum(failure[2] for failure in self.failures)
+
+    @property
+    def points_per_second(self):
+        return (self.points - self.failed_points) / self.seconds if self.seconds else 0.0
+
+    def __repr__(self):
+        return 'BulkLoadReport: %d points in %d chunks, %.3f seconds, %.0f points/sec, %d failed chunks' % \
+               (self.points, self.chunks, self.seconds, self.points_per_second, len(self.failures))
+
+
+class BulkLoader:
+    """
+    Parallel multi-worker loader of line protocol. Input is split into chunks which are
+    written concurrently by a pool of processes or threads
+    """
+
+    def __init__(self, host, port, dbname, user=None, password=None, http_timeout=50, http_retries=3,
+                 workers=4, chunk_size=5000, mode='process', retention_policy=None, precision='n',
+                 consistency=None):
+        """
+        :param workers: number of worker processes/threads
+        :param chunk_size: number of points (lines) in a single write request
+        :param mode: 'process' or 'thread' pool
+        :return:
+        """
+
+        if mode not in ('process', 'thread'):
+            raise ValueError('Unknown mode <%s>. Expected "process" or "thread"' % mode)
+
+        self.client_kwargs = {'host': host, 'port': port, 'user': user, 'password': password,
+                              'http_timeout': http_timeout, 'http_retries': http_retries}
+        self.write_kwargs = {'dbname': dbname, 'retention_policy': retention_policy, 'precision': precision,
+                             'consistency': consistency}
+        self.workers = workers
+        self.chunk_size = chunk_size
+        self.mode = mode
+
+    def load(self, source):
+        """
+        Writes all points from the source
+        :param source: see iter_chunks
+        :return: BulkLoadReport
+        """
+
+        executor_class = ProcessPoolExecutor if self.mode == 'process' else ThreadPoolExecutor
+        report = BulkLoadReport()
+        start = time()
+
+        def collect(done):
+            for future in done:
+                index, first_line, npoints, nbytes, seconds, error = future.result()
+                report.points += npoints
+                report.bytes += nbytes
+                report.chunks += 1
+                if error:
+                    report.failures.append((index, first_line, npoints, error))
+                    logging.error('Chunk %d (lines %d-%d) failed: %s' %
+                                  (index, first_line, first_line + npoints - 1, error))
+                else:
+                    logging.debug('Chunk %d: %d points written in %.3f seconds' % (index, npoints, seconds))
+
+        with executor_class(max_workers=self.workers) as executor:
+            pending = set()
+            for index, (first_line, npoints, chunk) in enumerate(iter_chunks(source, self.chunk_size)):
+                # bounded number of chunks in flight keeps memory flat for large inputs
+                if len(pending) >= 2 * self.workers:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    collect(done)
+                pending.add(executor.submit(_write_chunk, self.client_kwargs, index, first_line, npoints, chunk,
+                                            self.write_kwargs))
+            collect(wait(pending).done)
+
+        report.seconds = time() - start
+        logging.info(repr(report))
+        return report
+
+
+
+if __name__ == '__main__':
+
+    from measurements import DummyPoints
+
+    logging.basicConfig(format='%(levelname)-8s [%(asctime)s]  %(message)s',
+                        level=logging.INFO)
+
+    host = '10.6.74.70'
+    port = 8086
+    dbname = 'unittestdb'
+
+    DummyPoints('Tilt', npoints=100000, decimals=4, delta_seconds=600).dump('dump.txt')
+
+    loader = BulkLoader(host=host, port=port, dbname=dbname, workers=8, chunk_size=5000)
+    print(loader.load('dump.txt'))
@@ -0,0 +1,199 @@
+__author__ = 'Yury A. Kolotovichev'
+
+import re
+import threading
+from collections import OrderedDict
+from time import monotonic
+from Influxdb.measurements import _escape_name
+
+
+_quoted_or_space = re.compile(r'(\'(?:[^\'\\]|\\.)*\'|"(?:[^"\\]|\\.)*")|\s+')
+_statement_kind = re.compile(r'\s*(\w+)')
+_from_clause = re.compile(r'\bFROM\s+(.+?)(?=\s+(?:WHERE|GROUP|ORDER|LIMIT|OFFSET|SLIMIT|SOFFSET|FILL|TZ|INTO)\b|$)',
+                          re.IGNORECASE | re.DOTALL)
+_source = re.compile(r'(?:(?:"(?:[^"\\]|\\.)*"|\w+)?\.){0,2}("(?:[^"\\]|\\.)*"|\w+)|(/(?:[^/\\]|\\.)*/)|(\()')
+
+
+def normalize_query(query):
+    """
+    :return: query with whitespace outside of quoted strings and identifiers collapsed, trailing ';' dropped
+    """
+    return _quoted_or_space.sub(lambda match: match.group(1) or ' ', query).strip().rstrip(';').rstrip()
+
+
+def is_read_only(query):
+    """
+    :return: True if every statement of a query is SELECT (without INTO) or SHOW
+    """
+
+    for statement in _quoted_or_space.sub(lambda match: ' ' if match.group(1) is None else '""', query).split(';'):
+        match = _statement_kind.match(statement)
+        if match is None:
+            continue
+        kind = match.group(1).upper()
+        if kind not in ('SELECT', 'SHOW') or (kind == 'SELECT' and re.search(r'\bINTO\b', statement, re.I)):
+            return False
+    return True
+
+
+def read_measurements(query):
+    """
+    Measurements a query reads, taken from FROM clauses
+    :return: set of measurement names or None if the query may read any measurement
+             (regular expressions, subqueries, SHOW statements)
+    """
+
+    measurements = set()
+    for statement in query.split(';'):
+        match = _statement_kind.match(statement)
+        if match is None:
+            continue
+        if match.group(1).upper() != 'SELECT':
+            return None
+        sources = _from_clause.search(statement)
+        if sources is None:
+            return None
+        for name, regex, subquery in _source.findall(sources.group(1)):
+            if regex or subquery:
+                return None
+            if name.startswith('"'):
+                name = name[1:-1].replace('\\"', '"')
+            measurements.add(name)
+    return measurements
+
+
+class QueryCache:
+    """
+    Cache of query results: LRU bounded by the size of cached responses, every entry expires after its TTL.
+    Writes through the client invalidate entries reading measurements the points are written to.
+    Cached results are shared between callers and must not be modified
+    """
+
+    def __init__(self, max_bytes=64*1024*1024, ttl=10.0):
+        """
+        :param max_bytes: limit of total size of cached responses (bytes of JSON received)
+        :param ttl: default time to live of an entry (seconds)
+        :return:
+        """
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+
+        self.entries = OrderedDict()  # key -> (result, size, expires, measurements)
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._generations = {}  # dbname -> number of invalidations
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """
+        :param key: see key()
+        :return: cached result or None
+        """
+
+        with self._lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                if entry[2] > monotonic():
+                    self.entries.move_to_end(key)
+                    self.hits += 1
+                    return entry[0]
+                self._remove(key)
+            self.misses += 1
+        return None
+
+    @staticmethod
+    def key(dbname, query, epoch=None, columnar=False):
+        return dbname, normalize_query(query), epoch, columnar
+
+    def generation(self, dbname):
+        """
+        Taken before a query is sent and passed to put: result is not cached if the database
+        was written to meanwhile, as it may miss the written points
+        """
+        return self._generations.get(dbname, 0)
+
+    def put(self, key, result, size, generation, ttl=None):
+        """
+        :param key: see key()
+        :param result: parsed query result
+        :param size: size of the response (bytes)
+        :param generation: see generation()
+        :param ttl: time to live of the entry (seconds), default ttl if None, 0 disables caching
+        """
+
+        ttl = self.ttl if ttl is None else ttl
+        if ttl <= 0 or size > self.max_bytes or 'error' in result or \
+                any('error' in statement for statement in result.get('results', ())):
+            return
+        measurements = read_measurements(key[1])
+
+        with self._lock:
+            if self._generations.get(key[0], 0) != generation:
+                return
+            if key in self.entries:
+                self._remove(key)
+            self.entries[key] = (result, size, monotonic() + ttl, measurements)
+            self.nbytes += size
+            while self.nbytes > self.max_bytes:
+                self._remove(next(iter(self.entries)))
+
+    def _remove(self, key):
+        self.nbytes -= self.entries.pop(key)[1]
+
+    def invalidate(self, dbname, points=None):
+        """
+        Drops entries of a database affected by a write
+        :param points: line protocol written (bytes); if None or not inspectable, all entries of the database go
+        """
+
+        with self._lock:
+            self._generations[dbname] = self._generations.get(dbname, 0) + 1
+            keys = [key for key in self.entries if key[0] == dbname]
+            if not keys:
+                return
+
+            if not isinstance(points, (bytes, bytearray, memoryview)):
+                for key in keys:
+                    self._remove(key)
+                return
+
+            names = {}  # escaped name -> measurement
+            for key in keys:
+                for name in self.entries[key][3] or ():
+                    names[_escape_name(name).encode()] = name
+            written = set()
+            if names:
+                # a measurement is written if any line starts with its escaped name followed by ',' or ' '.
+                # Payload is scanned in place, memoryview slices of write_file are not copied
+                pattern = re.compile(b'^(' + b'|'.join(re.escape(name) for name in names) + b')[, ]', re.MULTILINE)
+                for match in pattern.finditer(points):
+                    written.add(names[match.group(1)])
+                    if len(written) == len(names):
+                        break
+            for key in keys:
+                measurements = self.entries[key][3]
+                if measurements is None or measurements & written:
+                    self._remove(key)
+
+    def invalidate_databases(self):
+        """
+        Drops cached SHOW DATABASES results of all databases, called when a database is created or dropped
+        """
+
+        with self._lock:
+            for key in [key for key in self.entries if key[1].upper().startswith('SHOW DATABASES')]:
+                self._generations[key[0]] = self._generations.get(key[0], 0) + 1
+                self._remove(key)
+
+    def clear(self):
+        with self._lock:
+            self.entries.clear()
+            self.nbytes = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __repr__(self):
+        return 'QueryCache: %d entries, %d bytes, %d hits, %d misses' % (len(self.entries), self.nbytes, self.hits,
+                                                                         self.misses)
@@ -0,0 +1,246 @@
+__author__ = 'Yury A. Kolotovichev'
+
+import logging
+import threading
+from itertools import count
+from time import time
+from concurrent.futures import ThreadPoolExecutor
+from Influxdb.influxdb import InfluxDBClient
+from Influxdb.exceptions import InfluxdbAPICodeMismatchError, InfluxdbAPIRequestError
+
+
+class Node:
+    """
+    Cluster node: client of a single InfluxDB instance and its health
+    """
+
+    def __init__(self, client):
+        self.client = client
+        self.outstanding = 0  # requests in flight
+        self.failures = 0  # consecutive failures
+        self.down_until = 0.0  # node is out of rotation until this time
+
+    @property
+    def healthy(self):
+        return self.down_until <= time()
+
+    def __repr__(self):
+        return 'Node: %s, %s, %d requests in flight' % (self.client.base_url,
+                                                       'healthy' if self.healthy else 'down', self.outstanding)
+
+
+class InfluxDBClusterClient:
+    """
+    Client of several independent InfluxDB instances. Writes and queries are spread across healthy nodes,
+    failing nodes are taken out of rotation for a cooldown period, writes may be replicated to several nodes
+    """
+
+    strategies = ('round_robin', 'least_outstanding')
+
+    def __init__(self, endpoints, user=None, password=None, http_timeout=50, http_retries=0,
+                 strategy='round_robin', replication=1, failure_threshold=1, cooldown=10.0, retry_policy=None):
+        """
+        :param endpoints: list of (host, port) tuples or 'host:port' strings
+        :param http_retries: retries on the same node before failing over to the next one
+        :param strategy: 'round_robin' or 'least_outstanding' (node with fewest requests in flight first)
+        :param replication: number of nodes every write is sent to
+        :param failure_threshold: consecutive failures which take a node out of rotation
+        :param cooldown: seconds a failed node stays out of rotation before it is tried again
+        :return:
+        """
+
+        if strategy not in self.strategies:
+            raise ValueError('Unknown strategy <%s>. Expected one of %s' % (strategy, str(self.strategies)))
+
+        self.nodes = []
+        for endpoint in endpoints:
+            host, port = endpoint.rsplit(':', 1) if isinstance(endpoint, str) else endpoint
+            self.nodes.append(Node(InfluxDBClient(host=host, port=port, user=user, password=password,
+                                                  http_timeout=http_timeout, http_retries=http_retries,
+                                                  retry_policy=retry_policy)))
+
+        self.strategy = strategy
+        self.replication = min(replication, len(self.nodes))
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+
+        self._counter = count()
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=len(self.nodes)) if self.replication > 1 else None
+
+    def _candidates(self):
+        """
+        :return: nodes in the order they should be tried: healthy ones by strategy, then failed ones
+                 (they are tried anyway when no healthy node is left)
+        """
+
+        healthy = [node for node in self.nodes if node.healthy]
+        down = sorted((node for node in self.nodes if not node.healthy), key=lambda node: node.down_until)
+
+        if self.strategy == 'round_robin' and healthy:
+            shift = next(self._counter) % len(healthy)
+            healthy = healthy[shift:] + healthy[:shift]
+        elif self.strategy == 'least_outstanding':
+            healthy.sort(key=lambda node: node.outstanding)
+        return healthy + down
+
+    def _call(self, node, method, *args, **kwargs):
+        with self._lock:
+            node.outstanding += 1
+        try:
+            result = getattr(node.client, method)(*args, **kwargs)
+            # InfluxDBClient.write returns 500 (the node failed to write to its peers) instead of raising
+            if method == 'write' and result is not None and result.status_code >= 500:
+                raise InfluxdbAPICodeMismatchError(result.text, result.status_code, (204, ))
+        except InfluxdbAPICodeMismatchError as err:
+            if err.code_received < 500:  # request is wrong, not the node
+                raise
+            self._failed(node, err)
+            raise
+        except InfluxdbAPIRequestError as err:
+            self._failed(node, err)
+            raise
+        finally:
+            with self._lock:
+                node.outstanding -= 1
+
+        with self._lock:
+            node.failures = 0
+            node.down_until = 0.0
+        return result
+
+    def _failed(self, node, err):
+        with self._lock:
+            node.failures += 1
+            if node.failures >= self.failure_threshold:
+                node.down_until = time() + self.cooldown
+                logging.warning('Node %s is out of rotation for %.1f seconds: %s' %
+                                (node.client.base_url, self.cooldown, err))
+
+    def _failover(self, method, candidates, *args, **kwargs):
+        """
+        Calls the method on candidates one by one until it succeeds
+        """
+
+        error = None
+        for node in candidates:
+            try:
+                return self._call(node, method, *args, **kwargs)
+            except InfluxdbAPICodeMismatchError as err:
+                if err.code_received < 500:
+                    raise
+                error = err
+            except InfluxdbAPIRequestError as err:
+                error = err
+        raise error if error is not None else InfluxdbAPIRequestError('No nodes available')
+
+    def write(self, dbname, points, retention_policy=None, precision=None, consistency=None, gzipped=False,
+              compress=False, compresslevel=6):
+        """
+        Writes points to `replication` nodes. See InfluxDBClient.write
+        :return: response of the first node written
+        """
+
+        # payload may be sent several times, so generators and files are read in memory
+        if not isinstance(points, (bytes, bytearray, memoryview)):
+            points = points.read() if hasattr(points, 'read') else b''.join(points)
+        kwargs = {'dbname': dbname, 'points': points, 'retention_policy': retention_policy, 'precision': precision,
+                  'consistency': consistency, 'gzipped': gzipped, 'compress': compress,
+                  'compresslevel': compresslevel}
+
+        candidates = self._candidates()
+        if self.replication == 1:
+            return self._failover('write', candidates, **kwargs)
+
+        # replicas are written concurrently, a failed replica fails over to the next spare node
+        spares = iter(candidates[self.replication:])
+        spares_lock = threading.Lock()
+
+        def replicate(node):
+            while True:
+                try:
+                    return self._call(node, 'write', **kwargs)
+                except InfluxdbAPICodeMismatchError as err:
+                    if err.code_received < 500:
+                        raise
+                except InfluxdbAPIRequestError:
+                    pass
+                with spares_lock:
+                    spare = next(spares, None)
+                if spare is None:
+                    raise InfluxdbAPIRequestError('No spare nodes left for a replica')
+                node = spare
+
+        futures = [self._executor.submit(replicate, node) for node in candidates[:self.replication]]
+
+        responses = []
+        error = None
+        for future in futures:
+            try:
+                responses.append(future.result())
+            except InfluxdbAPICodeMismatchError as err:
+                if err.code_received < 500:
+                    raise
+                error = err
+            except InfluxdbAPIRequestError as err:
+                error = err
+        if not responses:
+            raise error
+        if error is not None:
+            logging.warning('Points written to %d of %d replicas' % (len(responses), self.replication))
+        return responses[0]
+
+    def query(self, dbname, query, epoch=None, columnar=False):
+        """
+        See InfluxDBClient.query
+        """
+        return self._failover('query', self._candidates(), dbname, query, epoch=epoch, columnar=columnar)
+
+    def _on_all_nodes(self, method, *args):
+        succeeded = 0
+        error = None
+        for node in self.nodes:
+            try:
+                self._call(node, method, *args)
+                succeeded += 1
+            except InfluxdbAPICodeMismatchError as err:
+                if err.code_received < 500:
+                    raise
+                error = err
+            except InfluxdbAPIRequestError as err:
+                error = err
+        if not succeeded:
+            raise error
+        return True
+
+    def create_database(self, dbname):
+        """
+        Creates database on every reachable node
+        """
+        return self._on_all_nodes('create_database', dbname)
+
+    def drop_database(self, dbname):
+        """
+        Drops database on every reachable node
+        """
+        return self._on_all_nodes('drop_database', dbname)
+
+    def close(self):
+        """
+        Stops replication threads and closes connections of all nodes
+        """
+
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+        for node in self.nodes:
+            node.client.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def __repr__(self):
+        return 'InfluxDBClusterClient: %s' % ', '.join(node.client.base_url for node in self.nodes)
@@ -0,0 +1,142 @@
+__author__ = 'Yury A. Kolotovichev'
+
+import logging
+import threading
+from time import time
+from Influxdb.measurements import Measurement
+
+
+class _SeriesState:
+
+    __slots__ = ('values', 'sent_at', 'pending')
+
+    def __init__(self):
+        self.values = {}  # field -> last value sent
+        self.sent_at = None  # timestamp of the last point sent
+        self.pending = None  # last dropped point
+
+
+class DeadbandFilter:
+    """
+    Write path stage: a point is passed to the sink only if one of its fields changed by more than
+    the deadband since the last point sent for its series. A dropped point is still sent as a heartbeat
+    once the series has been silent for the heartbeat interval, and the last dropped point of every
+    series is sent on close, so the final value is never lost.
+    Sink is anything with append(*points): BatchWriter, WindowAggregator
+    """
+
+    def __init__(self, sink, deadband=0.0, relative=0.0, heartbeat=3600.0, time_precision='n'):
+        """
+        :param sink: object with append(*points) receiving passed points
+        :param deadband: absolute deadband: number for all fields or dict of field -> number
+        :param relative: relative deadband (fraction of the last sent value): number or dict of field -> number.
+                         Field change is significant if it exceeds both deadbands
+        :param heartbeat: maximum silence of a series (seconds), None disables heartbeats
+        :param time_precision: precision of point timestamps (n, u, ms, s, m, h)
+        :return:
+        """
+        self.sink = sink
+        self.deadband = deadband
+        self.relative = relative
+        self._unit = Measurement.precision_multipliers[time_precision]
+        self.heartbeat = int(heartbeat * 10**9) // self._unit if heartbeat is not None else None
+
+        self.series = {}  # (name, sorted tag items) -> _SeriesState
+        self.points = 0
+        self.passed = 0
+        self._lock = threading.Lock()
+
+    def _band(self, field, last):
+        absolute = self.deadband.get(field, 0.0) if isinstance(self.deadband, dict) else self.deadband
+        relative = self.relative.get(field, 0.0) if isinstance(self.relative, dict) else self.relative
+        return max(absolute, relative * abs(last))
+
+    def _changed(self, state, fields):
+        values = state.values
+        for field, value in fields.items():
+            if field not in values:
+                return True
+            last = values[field]
+            if isinstance(value, (int, float)) and not isinstance(value, bool) and \
+                    isinstance(last, (int, float)) and not isinstance(last, bool):
+                if abs(value - last) > self._band(field, last):
+                    return True
+            elif value != last:
+                return True
+        return False
+
+    def _send(self, state, measurement, timestamp):
+        state.values.update(measurement.fields)
+        state.sent_at = timestamp
+        state.pending = None
+
+    def append(self, *measurements):
+        """
+        Filters Measurement-like points (with name, tags, fields and timestamp)
+        """
+
+        passed = []
+        with self._lock:
+            for measurement in measurements:
+                self.points += 1
+                timestamp = measurement.timestamp or int(time() * 10**9) // self._unit
+                tags = measurement.tags
+                key = (measurement.name, tuple(sorted(tags.items())) if tags else ())
+                state = self.series.get(key)
+                if state is None:
+                    state = self.series[key] = _SeriesState()
+                elif not self._changed(state, measurement.fields) and \
+                        (self.heartbeat is None or timestamp - state.sent_at < self.heartbeat):
+                    state.pending = measurement
+                    continue
+                self._send(state, measurement, timestamp)
+                passed.append(measurement)
+            self.passed += len(passed)
+        if passed:
+            self.sink.append(*passed)
+
+    def _heartbeats(self, now=None):
+        """
+        :param now: send pending points of series silent for the heartbeat interval by now, all if None
+        """
+
+        wall_clock = int(time() * 10**9) // self._unit
+        passed = []
+        with self._lock:
+            for state in self.series.values():
+                if state.pending is not None and (now is None or now - state.sent_at >= self.heartbeat):
+                    passed.append(state.pending)
+                    self._send(state, state.pending, state.pending.timestamp or wall_clock)
+            self.passed += len(passed)
+        if passed:
+            self.sink.append(*passed)
+        return len(passed)
+
+    def flush(self):
+        """
+        Sends heartbeats of series silent for the heartbeat interval (by the wall clock) and flushes the sink
+        """
+
+        if self.heartbeat is not None:
+            self._heartbeats(int(time() * 10**9) // self._unit)
+        if hasattr(self.sink, 'flush'):
+            self.sink.flush()
+
+    def close(self):
+        """
+        Sends the last dropped point of every series, then closes the sink
+        """
+
+        self._heartbeats()
+        logging.info(repr(self))
+        if hasattr(self.sink, 'close'):
+            self.sink.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def __repr__(self):
+        return 'DeadbandFilter: %d of %d points passed' % (self.passed, self.points)
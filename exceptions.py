@@ -1,11 +1,26 @@
 __author__ = 'Yury A. Kolotovichev'
 import logging
 
-class InfluxdbAPICodeMismatchError(Exception):
+class InfluxdbAPIRequestError(Exception):
+    def __init__(self, message=''):
+
+        super(InfluxdbAPIRequestError, self).__init__(message)
+        logging.error('Error sending HTTP request to Influxdb server')
+
+
+class InfluxdbAPITimeoutError(InfluxdbAPIRequestError):
+    """Server did not respond in time"""
+
+
+class InfluxdbAPIConnectionError(InfluxdbAPIRequestError):
+    """Server is unreachable or connection was reset"""
+
+
+class InfluxdbAPICodeMismatchError(InfluxdbAPIRequestError):
     def __init__(self, content, code_received, codes_expected):
         message = "Code %s. Expected %s. %s" % (code_received, str(codes_expected), content)
 
-        super(InfluxdbAPICodeMismatchError, self).__init__(message)
+        Exception.__init__(self, message)
 
         self.content = content
         self.code_received = code_received
@@ -13,11 +28,9 @@ class InfluxdbAPICodeMismatchError(Exception):
         logging.error('Code %d. Expected %s. InfluxdbClientError: %s' % (self.code_received, codes_expected,
                                                                          self.content))
 
-class InfluxdbAPIRequestError(Exception):
-    def __init__(self, message=''):
 
-        super(InfluxdbAPIRequestError, self).__init__(message)
-        logging.error('Error sending HTTP request to Influxdb server')
+class ContainerFullError(Exception):
+    """Bounded container reached its point or byte limit"""
 
 
 
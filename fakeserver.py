@@ -0,0 +1,205 @@
+__author__ = 'Yury A. Kolotovichev'
+
+import json
+import zlib
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qs
+
+
+class FakeInfluxDBHandler(BaseHTTPRequestHandler):
+    """
+    Minimal InfluxDB HTTP API: /write, /query, /ping
+    """
+
+    protocol_version = 'HTTP/1.1'  # keep-alive, as the real server
+
+    def log_message(self, format, *args):
+        pass
+
+    def setup(self):
+        BaseHTTPRequestHandler.setup(self)
+        server = self.server.fake
+        with server.lock:
+            server.connections += 1
+
+    def _body_blocks(self):
+        """
+        Request body in blocks, chunked transfer encoding and gzip content encoding are decoded
+        """
+
+        if self.headers.get('Transfer-Encoding', '').lower() == 'chunked':
+            def blocks():
+                while True:
+                    size = int(self.rfile.readline().split(b';')[0].strip(), 16)
+                    if size == 0:
+                        while self.rfile.readline() not in (b'\r\n', b'\n', b''):  # trailers
+                            pass
+                        return
+                    yield self.rfile.read(size)
+                    self.rfile.readline()
+        else:
+            def blocks():
+                remaining = int(self.headers.get('Content-Length', 0))
+                while remaining:
+                    block = self.rfile.read(min(remaining, 64*1024))
+                    if not block:
+                        return
+                    remaining -= len(block)
+                    yield block
+
+        if self.headers.get('Content-Encoding', '').lower() == 'gzip':
+            decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+            for block in blocks():
+                yield decompressor.decompress(block)
+            yield decompressor.flush()
+        else:
+            yield from blocks()
+
+    def _respond(self, code, body=b''):
+        self.send_response(code)
+        if body:
+            self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        if body:
+            self.wfile.write(body)
+
+    def _injected(self):
+        # status code injected by FakeInfluxDBServer.fail_next
+        server = self.server.fake
+        with server.lock:
+            if server.failures:
+                return server.failures.pop(0)
+        return None
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        if url.path == '/ping':
+            self._respond(204)
+        elif url.path == '/query':
+            self._query(parse_qs(url.query))
+        else:
+            self._respond(404)
+
+    def do_POST(self):
+        url = urlsplit(self.path)
+        if url.path == '/write':
+            self._write(parse_qs(url.query))
+        elif url.path == '/query':
+            params = parse_qs(url.query)
+            body = b''.join(self._body_blocks())
+            if self.headers.get('Content-Type', '').startswith('application/x-www-form-urlencoded'):
+                params.update(parse_qs(body.decode()))
+            self._query(params)
+        else:
+            self._respond(404)
+
+    def _write(self, params):
+        server = self.server.fake
+        nbytes = 0
+        npoints = 0
+        last = b'\n'
+        stored = [] if server.store else None
+        for block in self._body_blocks():
+            if not block:
+                continue
+            nbytes += len(block)
+            npoints += block.count(b'\n')
+            last = block[-1:]
+            if stored is not None:
+                stored.append(block)
+        if last != b'\n':
+            npoints += 1
+
+        code = self._injected()
+        if code is not None:
+            self._respond(code, json.dumps({'error': 'injected failure'}).encode())
+            return
+
+        with server.lock:
+            server.requests += 1
+            server.points += npoints
+            server.bytes += nbytes
+            if stored is not None:
+                server.written.append((params.get('db', [None])[0], b''.join(stored)))
+        self._respond(204)
+
+    def _query(self, params):
+        server = self.server.fake
+        code = self._injected()
+        if code is not None:
+            self._respond(code, json.dumps({'error': 'injected failure'}).encode())
+            return
+
+        statements = [q for q in params.get('q', [''])[0].split(';') if q.strip()]
+        results = []
+        for statement_id, statement in enumerate(statements):
+            result = {'statement_id': statement_id}
+            result.update(server.query_results.get(statement.strip(), {}))
+            results.append(result)
+
+        with server.lock:
+            server.requests += 1
+            server.queries.append(statements)
+        self._respond(200, json.dumps({'results': results}).encode())
+
+
+class FakeInfluxDBServer:
+    """
+    In-process stand-in of InfluxDB HTTP API for tests and benchmarks. Written points are counted
+    (and optionally stored), queries are answered with canned results
+    """
+
+    def __init__(self, host='127.0.0.1', port=0, store=False):
+        """
+        :param port: 0 picks a free port
+        :param store: keep written line protocol in self.written as (dbname, bytes)
+        :return:
+        """
+        self.store = store
+        self.lock = threading.Lock()
+        self.query_results = {}  # statement -> result dict ('series', 'error')
+        self.failures = []  # status codes returned by next requests
+        self.reset()
+
+        self.httpd = ThreadingHTTPServer((host, port), FakeInfluxDBHandler)
+        self.httpd.daemon_threads = True
+        self.httpd.fake = self
+        self.host, self.port = self.httpd.server_address[:2]
+        self._thread = None
+
+    def reset(self):
+        with self.lock:
+            self.requests = 0
+            self.connections = 0  # connections accepted
+            self.points = 0
+            self.bytes = 0
+            self.written = []
+            self.queries = []
+
+    def fail_next(self, code, count=1):
+        """
+        Next count requests to /write or /query are answered with the code
+        """
+        with self.lock:
+            self.failures.extend([code] * count)
+
+    def start(self):
+        self._thread = threading.Thread(target=self.httpd.serve_forever, name='FakeInfluxDBServer', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        self._thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+    def __repr__(self):
+        return 'FakeInfluxDBServer: http://%s:%s, %d points written' % (self.host, self.port, self.points)
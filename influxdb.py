@@ -1,50 +1,338 @@
 __author__ = 'Yury A. Kolotovichev'
 
-import requests
 import logging
-from Influxdb.exceptions import InfluxdbAPICodeMismatchError, InfluxdbAPIRequestError
+import json
+import zlib
+import mmap
+import os
+import tempfile
+from urllib.parse import quote_plus
+from time import sleep, perf_counter
+from Influxdb.exceptions import InfluxdbAPICodeMismatchError, InfluxdbAPIRequestError, InfluxdbAPITimeoutError, \
+    InfluxdbAPIConnectionError
+from Influxdb.retry import RetryPolicy
+from Influxdb.cache import is_read_only
+from Influxdb.transport import transports
+
+try:
+    import numpy as np
+except ImportError:  # numpy is optional, it is required for columnar query results only
+    np = None
 
 
 
 
+def _debug_enabled():
+    # response text is decoded for debug/info logging only if the level is enabled
+    return logging.root.isEnabledFor(logging.DEBUG)
+
+
+def _info_enabled():
+    return logging.root.isEnabledFor(logging.INFO)
+
+
+def _count_lines(points):
+    """
+    :param points: line protocol bytes, bytearray or memoryview (counted in blocks, without copying it whole)
+    """
+
+    if isinstance(points, memoryview):
+        block = 1024*1024
+        return sum(bytes(points[start:start + block]).count(b'\n') for start in range(0, len(points), block))
+    return points.count(b'\n')
+
+
+class _Tally:
+    """
+    Counts bytes and lines of a chunked request body (generator) as they are sent
+    """
+
+    def __init__(self, chunks):
+        self.chunks = chunks
+        self.size = 0
+        self.lines = 0
+
+    def __iter__(self):
+        for chunk in self.chunks:
+            if isinstance(chunk, (bytes, bytearray, memoryview)):
+                self.size += len(chunk)
+                self.lines += _count_lines(chunk)
+            else:  # Measurement-like object, encoded by gzip_stream as a single line
+                self.lines += 1
+            yield chunk
+
+
+class _FileTally:
+    """
+    Counts lines of a file request body as it is read. Seeking (rewind before a retry) restarts the count
+    """
+
+    def __init__(self, f):
+        self.f = f
+        self.lines = 0
+
+    def read(self, size=-1):
+        block = self.f.read(size)
+        self.lines += block.count(b'\n')
+        return block
+
+    def __iter__(self):
+        return iter(lambda: self.read(64*1024), b'')
+
+    def seekable(self):
+        return self.f.seekable()
+
+    def tell(self):
+        return self.f.tell()
+
+    def seek(self, offset, whence=os.SEEK_SET):
+        self.lines = 0
+        return self.f.seek(offset, whence)
+
+
+def gzip_stream(points, compresslevel=6, read_size=64*1024):
+    """
+    Compresses line protocol incrementally (gzip format), so memory usage does not depend on payload size
+    :param points: bytes, binary file object or iterable of line protocol bytes/Measurement objects
+    :param compresslevel: gzip compression level 1..9
+    :param read_size: size of blocks read from file objects
+    :return: generator of compressed blocks
+    """
+
+    compressor = zlib.compressobj(compresslevel, zlib.DEFLATED, 16 + zlib.MAX_WBITS)  # gzip header and trailer
+
+    if hasattr(points, 'read'):
+        read = points.read
+        points = iter(lambda: read(read_size), b'')
+    elif isinstance(points, (bytes, bytearray, memoryview)):
+        points = (points, )
+
+    for data in points:
+        if not isinstance(data, (bytes, bytearray, memoryview)):
+            data = data.to_bytes()
+        compressed = compressor.compress(data)
+        if compressed:  # compressor buffers input internally and returns data in large blocks
+            yield compressed
+    yield compressor.flush()
+
+
+def line_slices(buffer, slice_size):
+    """
+    Splits line protocol into slices of about slice_size bytes, a line is never cut in half
+    :param buffer: bytes-like object with find/rfind (bytes, mmap)
+    :return: generator of (start, end) offsets
+    """
+
+    size = len(buffer)
+    start = 0
+    while start < size:
+        end = start + slice_size
+        if end >= size:
+            yield start, size
+            return
+        cut = buffer.rfind(b'\n', start, end)
+        if cut == -1:  # line is longer than a slice
+            cut = buffer.find(b'\n', end)
+            if cut == -1:
+                yield start, size
+                return
+        yield start, cut + 1
+        start = cut + 1
+
+
+def split_batch(points):
+    """
+    Splits line protocol in two halves on the line boundary closest to the middle
+    :return: (first half, second half) or None if points contain a single line
+    """
+
+    points = bytes(points) if isinstance(points, memoryview) else points
+    middle = len(points) // 2
+    end = points.rfind(b'\n', 0, middle)
+    if end == -1:
+        end = points.find(b'\n', middle)
+    if end == -1 or end + 1 >= len(points.rstrip(b'\n')):
+        return None
+    return points[:end + 1], points[end + 1:]
+
+
+def series_to_columns(series):
+    """
+    Converts 'values' of a query result series (list of rows) into a dict of NumPy column arrays.
+    Time column becomes int64 (query has to be made with epoch), columns with nulls become float64 with NaN
+    :param series: series dict from query result
+    :return: series dict with 'values' replaced by {column name: array}
+    """
+
+    if np is None:
+        raise ImportError('numpy is required for columnar query results')
+
+    rows = series.get('values') or ()
+    names = series['columns']
+    columns = zip(*rows) if rows else [()] * len(names)
+
+    arrays = {}
+    for name, column in zip(names, columns):
+        if name == 'time':
+            array = np.array(column, dtype=np.int64)
+        else:
+            array = np.array(column)
+            if array.dtype == object or not column:  # nulls, mixed types or empty column
+                try:
+                    array = np.array(column, dtype=np.float64)
+                except (TypeError, ValueError):
+                    pass
+        arrays[name] = array
+
+    columnar = dict(series)
+    columnar['values'] = arrays
+    return columnar
+
+
+def pack_statements(statements, max_bytes):
+    """
+    Packs statements into groups sent in a single request: every group is as large as possible,
+    but its urlencoded 'q' form field does not exceed max_bytes (unless it is a single longer statement)
+    :param statements: list of statements
+    :return: generator of lists of statement indexes
+    """
+
+    group = []
+    size = 0
+    for index, statement in enumerate(statements):
+        length = len(quote_plus(statement)) + (3 if group else 0)  # joined by urlencoded ';'
+        if group and size + length > max_bytes:
+            yield group
+            group = []
+            length -= 3
+            size = 0
+        group.append(index)
+        size += length
+    if group:
+        yield group
+
+
 class InfluxDBClient:
-    def __init__(self, host, port, user=None, password=None, http_timeout=50, http_retries=3):
+    def __init__(self, host, port, user=None, password=None, http_timeout=50, http_retries=3, spool=None,
+                 retry_policy=None, metrics=None, query_cache=None, transport='requests', pool_size=100,
+                 keep_alive=True):
+        """
+        :param http_retries: number of retries of the default retry policy
+        :param spool: WriteSpool instance. Writes failed because of the server being unreachable or
+                      returning 5xx are spooled on disk and replayed in background
+        :param retry_policy: RetryPolicy instance, overrides http_retries
+        :param metrics: MetricsSink instance (ClientMetrics, InfluxDBMetricsReporter)
+        :param query_cache: QueryCache instance. Results of read-only queries are cached,
+                            writes through this client invalidate affected entries
+        :param transport: 'requests', 'http.client' (lean keep-alive transport with less per-request overhead)
+                          or a Transport instance
+        :param pool_size: number of connections kept open to the server (built-in transports)
+        :param keep_alive: reuse connections between requests (built-in transports)
+        """
         self.host = host
         self.port = port
         self.user = user
         self.password = password
         self.http_timeout = http_timeout
         self.base_url = 'http://%s:%s' % (host, port)
-
-        self.HTTPsession = requests.Session()
-        adapter = requests.adapters.HTTPAdapter(pool_connections=100, pool_maxsize=100, max_retries=http_retries)
-        self.HTTPsession.mount('http://', adapter)
-
-    def _request(self, url, method, expected_response_codes, headers=None, params=None, data=None):
-        """Make a HTTP request"""
-
-        try:
-            r = self.HTTPsession.request(url=url,
-                                         method=method,
-                                         headers=headers,
-                                         params=params,
-                                         data=data,
-                                         timeout=self.http_timeout)
-
-            if r.status_code in expected_response_codes:
-                logging.debug('HTTP request completed with expected code %d. %s' % (r.status_code, r.text))
-                return r
+        self.retry_policy = retry_policy if retry_policy is not None else RetryPolicy(max_retries=http_retries)
+        self.metrics = metrics
+        self.query_cache = query_cache
+
+        # retries are made by _request according to the retry policy
+        if isinstance(transport, str):
+            if transport not in transports:
+                raise ValueError('Unknown transport <%s>. Expected one of %s' % (transport, str(tuple(transports))))
+            transport = transports[transport](pool_size=pool_size, keep_alive=keep_alive)
+        self.transport = transport
+        self.HTTPsession = getattr(transport, 'session', None)  # requests.Session of RequestsTransport
+
+        self.spool = spool
+        if spool is not None:
+            spool.start(self._replay_write)
+
+    def _request(self, url, method, expected_response_codes, headers=None, params=None, data=None, stream=False):
+        """Make a HTTP request, retried according to the retry policy"""
+
+        # generators can be sent only once, files are rewound before retrying
+        position = None
+        if hasattr(data, 'seek') and data.seekable():
+            position = data.tell()
+        replayable = data is None or position is not None or isinstance(data, (bytes, bytearray, memoryview, str))
+
+        metrics = self.metrics
+        if metrics is not None:
+            endpoint = url.rsplit('/', 1)[-1]
+            bytes_sent = 0  # form data and non-seekable files are not counted
+            if isinstance(data, (bytes, bytearray, memoryview, str)):
+                bytes_sent = len(data)
+            elif hasattr(data, '__iter__') and not hasattr(data, 'read') and not isinstance(data, (dict, list, tuple)):
+                data = _Tally(data)  # generator: size is known after the request
+
+        attempt = 0
+        while True:
+            retry_after = None
+            if metrics is not None:
+                started = perf_counter()
+            try:
+                r = self.transport.request(method=method,
+                                           url=url,
+                                           headers=headers,
+                                           params=params,
+                                           data=data,
+                                           timeout=self.http_timeout,
+                                           stream=stream)
+            except (InfluxdbAPITimeoutError, InfluxdbAPIConnectionError) as err:
+                error = err
+            except InfluxdbAPIRequestError as err:
+                if metrics is not None:
+                    metrics.error(endpoint, err)
+                raise
             else:
-                raise InfluxdbAPICodeMismatchError(r.text, r.status_code, expected_response_codes)
-
-        except:
-            raise InfluxdbAPIRequestError()
+                if metrics is not None:
+                    if isinstance(data, _Tally):
+                        bytes_sent = data.size
+                    elif position is not None:  # file
+                        bytes_sent = data.tell() - position
+                    bytes_received = int(r.headers.get('Content-Length', 0)) if stream else len(r.content)
+                    metrics.request(endpoint, perf_counter() - started, bytes_sent, bytes_received)
+
+                if r.status_code in expected_response_codes:
+                    if _debug_enabled():
+                        if stream:  # body is not read yet
+                            logging.debug('HTTP request completed with expected code %d. Streaming response' %
+                                          r.status_code)
+                        else:
+                            logging.debug('HTTP request completed with expected code %d. %s' %
+                                          (r.status_code, r.text))
+                    return r
+                error = InfluxdbAPICodeMismatchError(r.text, r.status_code, expected_response_codes)
+                retry_after = r.headers.get('Retry-After')
+
+            if not replayable or not self.retry_policy.should_retry(attempt, error):
+                if metrics is not None:
+                    metrics.error(endpoint, error)
+                raise error
+
+            if metrics is not None:
+                metrics.retry(endpoint, error)
+            delay = self.retry_policy.delay(attempt, retry_after)
+            logging.warning('Request to %s failed (%s), retry %d in %.3f seconds' %
+                            (url, type(error).__name__, attempt + 1, delay))
+            sleep(delay)
+            if position is not None:
+                data.seek(position)
+            attempt += 1
 
     def create_database(self, dbname):
         url = '%s/%s' % (self.base_url, 'query')
         params = {'q': 'CREATE DATABASE %s' % dbname, 'u': self.user, 'p': self.password}
 
-        self._request(url=url, method='GET', params=params, expected_response_codes=(200, ))
+        try:
+            self._request(url=url, method='GET', params=params, expected_response_codes=(200, ))
+        finally:
+            if self.query_cache is not None:
+                self.query_cache.invalidate_databases()
         logging.info('Database <%s> created or already exists' % dbname)
 
         return True
@@ -53,43 +341,359 @@ class InfluxDBClient:
         url = '%s/%s' % (self.base_url, 'query')
         params = {'q': 'DROP DATABASE %s' % dbname, 'u': self.user, 'p': self.password}
 
-        self._request(url=url, method='GET', params=params, expected_response_codes=(200, ))
+        try:
+            self._request(url=url, method='GET', params=params, expected_response_codes=(200, ))
+        finally:
+            if self.query_cache is not None:
+                self.query_cache.invalidate(dbname)
+                self.query_cache.invalidate_databases()
         logging.info('Database <%s> dropped' % dbname)
 
         return True
 
-    def write(self, dbname, points, retention_policy=None, precision=None, consistency=None, gzipped=False):
+    def write(self, dbname, points, retention_policy=None, precision=None, consistency=None, gzipped=False,
+              compress=False, compresslevel=6):
+        """
+        :param points: line protocol as bytes, binary file object or generator of bytes (chunked POST)
+        :param gzipped: points are already gzipped
+        :param compress: gzip points on the fly while sending them (chunked POST)
+        :param compresslevel: gzip compression level used with compress=True
+        :return: response, or None if points were spooled (client with spool only)
+        """
+
+        if gzipped and compress:
+            raise ValueError('Points are already gzipped, compress=True is not applicable')
+
+        if self.spool is None:
+            return self._write(dbname, points, retention_policy, precision, consistency, gzipped, compress,
+                               compresslevel)
+
+        params = {'dbname': dbname, 'retention_policy': retention_policy, 'precision': precision,
+                  'consistency': consistency, 'gzipped': gzipped, 'compress': compress,
+                  'compresslevel': compresslevel}
+
+        # if the spool is not empty, points go after the spooled ones to keep the order
+        if isinstance(points, (bytes, bytearray, memoryview)):
+            r = None if self.spool.pending else self._try_write(params, points)
+            if r is None:
+                self.spool.append(params, points)
+            return r
+
+        # generators and files are copied to disk while they are sent, so a failed batch can be spooled
+        # without reading it in memory
+        source = iter(lambda: points.read(64*1024), b'') if hasattr(points, 'read') else iter(points)
+        with tempfile.TemporaryFile(dir=self.spool.directory) as copy:
+            def tee():
+                for chunk in source:
+                    copy.write(chunk)
+                    yield chunk
+
+            r = None if self.spool.pending else self._try_write(params, tee())
+            if r is None:
+                for chunk in source:  # the rest of the batch, not sent by the failed request
+                    copy.write(chunk)
+                copy.seek(0)
+                self.spool.append(params, copy)
+            return r
+
+    def _try_write(self, params, points):
+        """
+        Writes points of a client with spool
+        :return: response, or None if the server is unreachable or failed and points should be spooled
+        """
+
+        try:
+            r = self._write(points=points, **params)
+            if r.status_code != 500:
+                return r
+        except InfluxdbAPICodeMismatchError as err:
+            if err.code_received < 500:
+                raise
+        except InfluxdbAPIRequestError:
+            pass
+        return None
+
+    def write_file(self, dbname, path, slice_size=4*1024*1024, retention_policy=None, precision=None,
+                   consistency=None):
+        """
+        Writes a line protocol dump (text or gzip file). File is memory-mapped and sent without
+        copying it into Python bytes: text is sent in line-aligned slices of about slice_size bytes (one POST each),
+        gzip file can't be cut on line boundaries without decompression, it is streamed as is in a single POST
+        :return: number of POST requests made
+        """
+
+        with open(path, 'rb') as f:
+            if not os.fstat(f.fileno()).st_size:
+                return 0
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                view = memoryview(mapped)
+                try:
+                    if path.endswith('.gz'):
+                        blocks = (view[start:start + slice_size] for start in range(0, len(view), slice_size))
+                        self.write(dbname, blocks, retention_policy, precision, consistency, gzipped=True)
+                        return 1
+
+                    requests_made = 0
+                    for start, end in line_slices(mapped, slice_size):
+                        with view[start:end] as points:
+                            self.write(dbname, points, retention_policy, precision, consistency)
+                        requests_made += 1
+                    return requests_made
+                finally:
+                    view.release()
+
+    def _replay_write(self, params, points):
+        """
+        Sends a batch replayed from the spool
+        :return: True if the batch should be removed from the spool
+        """
+
+        try:
+            r = self._write(points=points, **params)
+        except InfluxdbAPICodeMismatchError as err:
+            if err.code_received < 500:  # rejected by the server, replaying it again would not help
+                logging.error('Spooled batch of %d bytes dropped: %s' % (len(points), err))
+                return True
+            return False
+        except InfluxdbAPIRequestError:
+            return False
+        return r.status_code != 500
+
+    def _write(self, dbname, points, retention_policy=None, precision=None, consistency=None, gzipped=False,
+               compress=False, compresslevel=6):
 
         url = '%s/%s' % (self.base_url, 'write')
         headers = {}
         params = {'db': dbname, 'u': self.user, 'p': self.password,
                   'rp': retention_policy, 'precision': precision, 'consistency': consistency}
 
-        if gzipped:  # request body gzipped
+        if gzipped or compress:  # request body gzipped
                 headers = {'Content-encoding': 'gzip'}
 
-        r = self._request(url=url,
-                          method='POST',
-                          params=params,
-                          data=points,
-                          headers=headers,
-                          expected_response_codes=(204, 500))
-        logging.info('Code %d: %s. Points added to database' % (r.status_code, r.text))
+        data = points
+        tally = None  # lines of streamed points are counted while they are sent
+        if self.metrics is not None and not gzipped and not isinstance(points, (bytes, bytearray, memoryview)):
+            data = tally = _FileTally(points) if hasattr(points, 'read') else _Tally(points)
+        if compress:
+            data = gzip_stream(data, compresslevel=compresslevel)
+            if isinstance(points, (bytes, bytearray, memoryview)):  # already in memory, keep it retryable
+                data = b''.join(data)
+
+        try:
+            r = self._request(url=url,
+                              method='POST',
+                              params=params,
+                              data=data,
+                              headers=headers,
+                              expected_response_codes=(204, 500))
+        except InfluxdbAPICodeMismatchError as err:
+            if self.query_cache is not None:
+                self.query_cache.invalidate(dbname, None if gzipped else points)
+            # request entity too large: batch is split in two halves on a line boundary
+            if err.code_received != 413 or gzipped or not isinstance(points, (bytes, bytearray, memoryview)):
+                raise
+            halves = split_batch(points)
+            if halves is None:  # single line
+                raise
+            logging.warning('Batch of %d bytes is too large, writing it in two halves' % len(points))
+            self._write(dbname, halves[0], retention_policy, precision, consistency, gzipped, compress,
+                        compresslevel)
+            return self._write(dbname, halves[1], retention_policy, precision, consistency, gzipped, compress,
+                               compresslevel)
+
+        if self.query_cache is not None:
+            self.query_cache.invalidate(dbname, None if gzipped else points)
+        if self.metrics is not None and r.status_code == 204 and not gzipped:  # gzipped points are not counted
+            self.metrics.points_written(_count_lines(points) if tally is None else tally.lines)
+        if _info_enabled():
+            logging.info('Code %d: %s. Points added to database' % (r.status_code, r.text))
 
         return r
 
-    def query(self, dbname, query):
+    def query(self, dbname, query, epoch=None, columnar=False, cache_ttl=None):
+        """
+        :param epoch: return timestamps as epoch in given precision (n, u, ms, s, m, h) instead of RFC3339 strings
+        :param columnar: return values of every series as NumPy column arrays (see series_to_columns),
+                         timestamps are int64 epoch (nanoseconds unless epoch is given)
+        :param cache_ttl: seconds the result stays in query cache (client with query_cache only),
+                          cache default if None, 0 bypasses the cache
+        """
+
+        url = '%s/%s' % (self.base_url, 'query')
+        if columnar and epoch is None:
+            epoch = 'n'
+        params = {'db': dbname, 'q': query, 'u': self.user, 'p': self.password, 'epoch': epoch}
+
+        cache = self.query_cache
+        changes_data = False
+        if cache is not None:
+            changes_data = not is_read_only(query)  # e.g. DELETE, DROP, SELECT INTO
+            if changes_data or cache_ttl == 0:
+                cache = None
+            else:
+                key = cache.key(dbname, query, epoch, columnar)
+                result = cache.get(key)
+                if result is not None:
+                    return result
+                generation = cache.generation(dbname)
+
+        try:
+            r = self._request(url=url, method='GET', params=params, expected_response_codes=(200, ))
+        finally:
+            if changes_data:
+                self.query_cache.invalidate(dbname)
+        if _info_enabled():
+            logging.info('Code %d: %s. Data queried.' % (r.status_code, r.text))
+
+        result = r.json()
+        if columnar:
+            for statement in result.get('results', ()):
+                if 'series' in statement:
+                    statement['series'] = [series_to_columns(series) for series in statement['series']]
+        if cache is not None:
+            cache.put(key, result, len(r.content), generation, ttl=cache_ttl)
+        return result
+
+    def query_many(self, dbname, statements, epoch=None, max_bytes=64*1024):
+        """
+        Sends many statements in as few POST /query requests as possible (form bodies of up to max_bytes)
+        and splits the responses back per statement. A statement failing to parse fails the whole request
+        on the server, so statements of such a request are retried one by one to isolate it
+        :param dbname: database name (None for statements like CREATE DATABASE)
+        :param statements: list of single statements
+        :param epoch: see query
+        :param max_bytes: maximum size of a request body
+        :return: list of result dicts, one per statement, in the given order ('statement_id' is the index
+                 of the statement in the list, failed statements have 'error')
+        """
+
+        statements = [statement.strip().rstrip(';') for statement in statements]
+        results = [None] * len(statements)
+        try:
+            for group in pack_statements(statements, max_bytes):
+                self._query_group(dbname, statements, group, epoch, results)
+        finally:
+            if self.query_cache is not None and not all(is_read_only(statement) for statement in statements):
+                self.query_cache.invalidate(dbname)
+        logging.info('%d statements queried' % len(statements))
+        return results
+
+    def _query_group(self, dbname, statements, group, epoch, results):
         url = '%s/%s' % (self.base_url, 'query')
-        params = {'db': dbname, 'q': query, 'u': self.user, 'p': self.password}
+        params = {'db': dbname, 'u': self.user, 'p': self.password, 'epoch': epoch}
+        headers = {'Content-Type': 'application/x-www-form-urlencoded'}
+
+        while group:
+            data = 'q=' + quote_plus(';'.join([statements[index] for index in group]))
+            try:
+                r = self._request(url=url, method='POST', params=params, data=data, headers=headers,
+                                  expected_response_codes=(200, ))
+            except InfluxdbAPICodeMismatchError as err:
+                if err.code_received != 400:
+                    raise
+                if len(group) == 1:
+                    results[group[0]] = {'statement_id': group[0], 'error': err.content}
+                    return
+                for index in group:
+                    self._query_group(dbname, statements, [index], epoch, results)
+                return
+
+            received = r.json()
+            if 'error' in received:
+                raise InfluxdbAPIRequestError(received['error'])
+            for position, result in enumerate(received.get('results', ())):
+                if result.get('error') == 'not executed':
+                    continue
+                index = group[result.get('statement_id', position)]
+                result['statement_id'] = index
+                results[index] = result
+
+            # server stops executing statements after a failed one: the rest are missing or
+            # reported as 'not executed' and are sent again
+            remaining = [index for index in group if results[index] is None]
+            if len(remaining) == len(group):
+                for index in group:
+                    results[index] = {'statement_id': index, 'error': 'No result received'}
+                return
+            group = remaining
+
+    def query_chunked(self, dbname, query, chunk_size=10000, epoch=None, columnar=False):
+        """
+        Streaming query. Server sends results in chunks of chunk_size rows, which are parsed one by one
+        as they arrive, so memory usage is bounded by a chunk regardless of result size
+        :param epoch: see query
+        :param columnar: see query
+        :return: generator of series dicts ('name', 'tags', 'columns', 'values'). A long series
+                 is split into several consecutive dicts ('partial': True on all but the last one)
+        """
 
-        r = self._request(url=url, method='GET', params=params, expected_response_codes=(200, ))
-        logging.info('Code %d: %s. Data queried.' % (r.status_code, r.text))
-        return r.json()
+        url = '%s/%s' % (self.base_url, 'query')
+        if columnar and epoch is None:
+            epoch = 'n'
+        params = {'db': dbname, 'q': query, 'u': self.user, 'p': self.password,
+                  'chunked': 'true', 'chunk_size': chunk_size, 'epoch': epoch}
+
+        r = self._request(url=url, method='GET', params=params, expected_response_codes=(200, ), stream=True)
+        try:
+            for line in r.iter_lines(chunk_size=64*1024):
+                if not line:
+                    continue
+                chunk = json.loads(line)
+                if 'error' in chunk:
+                    raise InfluxdbAPIRequestError(chunk['error'])
+                for result in chunk.get('results', ()):
+                    if 'error' in result:
+                        raise InfluxdbAPIRequestError(result['error'])
+                    for series in result.get('series', ()):
+                        yield series_to_columns(series) if columnar else series
+        finally:
+            r.close()
+        logging.info('Code %d. Data queried in chunks.' % r.status_code)
+
+    def close(self):
+        """
+        Closes connections of the transport
+        """
+        self.transport.close()
 
     def __repr__(self):
         return 'InfluxDBClient: %s' % self.base_url
 
 
+class QueryBatch:
+    """
+    Collects statements of many callers and runs them together with InfluxDBClient.query_many
+    """
+
+    def __init__(self, client, dbname, epoch=None, max_bytes=64*1024):
+        self.client = client
+        self.dbname = dbname
+        self.epoch = epoch
+        self.max_bytes = max_bytes
+        self.statements = []
+
+    def add(self, statement):
+        """
+        :return: index of the statement result in the list returned by execute
+        """
+        self.statements.append(statement)
+        return len(self.statements) - 1
+
+    def execute(self):
+        """
+        Runs collected statements, the batch is emptied
+        :return: list of result dicts, see InfluxDBClient.query_many
+        """
+        statements, self.statements = self.statements, []
+        return self.client.query_many(self.dbname, statements, epoch=self.epoch, max_bytes=self.max_bytes)
+
+    def __len__(self):
+        return len(self.statements)
+
+    def __repr__(self):
+        return 'QueryBatch: %d statements for <%s>' % (len(self.statements), self.dbname)
+
+
 
 if __name__ == '__main__':
 
@@ -149,6 +753,14 @@ if __name__ == '__main__':
     # from gzip file (non-chunked)
     # with Timer('From gzip file'):
     #     dbclient.write(dbname=dbname, points=open('dump.gz', 'rb'), gzipped=True, precision='n')
+    #
+    # generator compressed on the fly (chunked, compressed)
+    # with Timer('Generator-compressed on the fly'):
+    #     dbclient.write(dbname=dbname, points=dummies, compress=True, precision='n')
+    #
+    # from text file compressed on the fly (chunked, compressed)
+    # with Timer('From text file-compressed on the fly'):
+    #     dbclient.write(dbname=dbname, points=open('dump.txt', 'rb'), compress=True, precision='n')
 
 
 
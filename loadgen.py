@@ -0,0 +1,211 @@
+__author__ = 'Yury A. Kolotovichev'
+
+import logging
+import threading
+from time import perf_counter, sleep
+from concurrent.futures import ThreadPoolExecutor
+from Influxdb.influxdb import InfluxDBClient
+from Influxdb.measurements import DummyPoints
+from Influxdb.metrics import Histogram
+from Influxdb.exceptions import InfluxdbAPIRequestError
+
+
+class Stage:
+    """
+    Load stage: constant arrival rate of points for a period of time
+    """
+
+    def __init__(self, name, seconds, rate):
+        """
+        :param name: stage name (warm-up, steady, spike, ...)
+        :param seconds: stage duration
+        :param rate: target points per second
+        :return:
+        """
+        self.name = name
+        self.seconds = seconds
+        self.rate = rate
+
+    def __repr__(self):
+        return 'Stage: %s, %.1f seconds at %.0f points/sec' % (self.name, self.seconds, self.rate)
+
+
+def parse_stages(text):
+    """
+    :param text: 'name:seconds:rate,...', e.g. 'warmup:30:10000,steady:300:50000,spike:30:200000'
+    :return: list of Stage objects
+    """
+
+    stages = []
+    for item in text.split(','):
+        name, seconds, rate = item.split(':')
+        stages.append(Stage(name, float(seconds), float(rate)))
+    return stages
+
+
+class StageResult:
+    """
+    Outcome of a stage. Latency is measured from the time a batch was scheduled to be sent, so time spent
+    waiting for a free sender counts (no coordinated omission). Service time is measured from the actual send
+    """
+
+    def __init__(self, stage):
+        self.stage = stage
+        self.batches = 0
+        self.points = 0
+        self.errors = 0
+        self.dropped = 0  # batches not sent because the backlog was full
+        self.latency = Histogram()
+        self.service_time = Histogram()
+
+    def snapshot(self):
+        return {'stage': self.stage.name, 'seconds': self.stage.seconds, 'target_rate': self.stage.rate,
+                'rate': self.points / self.stage.seconds if self.stage.seconds else 0.0,
+                'batches': self.batches, 'points': self.points, 'errors': self.errors, 'dropped': self.dropped,
+                'latency': self.latency.snapshot(), 'service_time': self.service_time.snapshot()}
+
+    def __repr__(self):
+        return 'StageResult: %s, %d points, %d errors, %d dropped, p99 latency %s' % (
+            self.stage.name, self.points, self.errors, self.dropped, self.latency.percentile(99))
+
+
+class LoadGenerator:
+    """
+    Open-loop load driver: batches are sent at a constant arrival rate of every stage, regardless of
+    how fast the server responds. A slow server builds up a backlog instead of slowing the load down
+    """
+
+    def __init__(self, client, dbname, stages, batch_size=5000, workers=8, max_backlog=1000, source=None,
+                 name='loadgen', tags=None, nfields=3, decimals=3, seed=None, precision='n'):
+        """
+        :param client: InfluxDBClient instance
+        :param dbname: database name
+        :param stages: list of Stage objects
+        :param batch_size: points per write
+        :param workers: number of concurrent senders
+        :param max_backlog: batches waiting for a sender; when exceeded, batches are dropped and counted
+        :param source: iterable of line protocol batches of batch_size points, DummyPoints chunks by default
+        :param name, tags, nfields, decimals, seed: DummyPoints settings of the default source
+        :return:
+        """
+        self.client = client
+        self.dbname = dbname
+        self.stages = stages
+        self.batch_size = batch_size
+        self.workers = workers
+        self.max_backlog = max_backlog
+        self.precision = precision
+
+        if source is None:
+            npoints = sum(int(stage.seconds * stage.rate / batch_size) for stage in stages) * batch_size
+            source = DummyPoints(name, npoints=npoints, decimals=decimals, opt='chunks', tags=tags, nfields=nfields,
+                                 chunk_size=batch_size, seed=seed)
+        self.source = iter(source)
+
+        self._lock = threading.Lock()
+        self._backlog = 0
+
+    def _send(self, result, intended, payload):
+        started = perf_counter()
+        try:
+            r = self.client.write(dbname=self.dbname, points=payload, precision=self.precision)
+            failed = r is not None and r.status_code >= 500  # InfluxDBClient.write returns 500 instead of raising
+        except InfluxdbAPIRequestError:
+            failed = True
+        finished = perf_counter()
+        npoints = payload.count(b'\n')
+        if payload and not payload.endswith(b'\n'):
+            npoints += 1
+
+        with self._lock:
+            self._backlog -= 1
+            result.batches += 1
+            if failed:
+                result.errors += 1
+            else:
+                result.points += npoints
+            result.latency.record(finished - intended)
+            result.service_time.record(finished - started)
+
+    def run(self):
+        """
+        Runs all stages one after another. Run stops early if the source is exhausted
+        :return: list of StageResult objects of stages run
+        """
+
+        results = []
+        exhausted = False
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            start = perf_counter()
+            for stage in self.stages:
+                if exhausted:
+                    break
+                result = StageResult(stage)
+                results.append(result)
+                interval = self.batch_size / stage.rate
+                nbatches = int(stage.seconds * stage.rate / self.batch_size)
+                logging.info('Load stage <%s>: %d batches every %.4f seconds' % (stage.name, nbatches, interval))
+
+                for i in range(nbatches):
+                    # schedule is fixed in advance: a late batch does not shift the following ones
+                    intended = start + i * interval
+                    delay = intended - perf_counter()
+                    if delay > 0:
+                        sleep(delay)
+                    payload = next(self.source, None)
+                    if payload is None:
+                        logging.warning('Load source is exhausted, run stopped in stage <%s>' % stage.name)
+                        exhausted = True
+                        break
+                    with self._lock:
+                        if self._backlog >= self.max_backlog:
+                            result.dropped += 1
+                            continue
+                        self._backlog += 1
+                    executor.submit(self._send, result, intended, payload)
+                start += nbatches * interval
+
+        for result in results:
+            logging.info(repr(result))
+        return results
+
+
+if __name__ == '__main__':
+
+    import argparse
+    import json
+
+    parser = argparse.ArgumentParser(description='Open-loop write load generator')
+    parser.add_argument('--host', default='localhost')
+    parser.add_argument('--port', type=int, default=8086)
+    parser.add_argument('--db', default='loadgen')
+    parser.add_argument('--stages', default='warmup:30:10000,steady:300:50000,spike:30:200000',
+                        help='name:seconds:points_per_second,...')
+    parser.add_argument('--batch-size', type=int, default=5000)
+    parser.add_argument('--workers', type=int, default=8)
+    parser.add_argument('--series', type=int, default=100)
+    parser.add_argument('--fields', type=int, default=3)
+    parser.add_argument('--seed', type=int)
+    parser.add_argument('--output', help='results JSON file')
+    args = parser.parse_args()
+
+    logging.basicConfig(format='%(levelname)-8s [%(asctime)s]  %(message)s',
+                        level=logging.INFO)
+
+    client = InfluxDBClient(host=args.host, port=args.port, http_retries=0)
+    client.create_database(args.db)
+    generator = LoadGenerator(client, args.db, parse_stages(args.stages), batch_size=args.batch_size,
+                              workers=args.workers, tags={'sensor': args.series}, nfields=args.fields,
+                              seed=args.seed)
+    results = [result.snapshot() for result in generator.run()]
+
+    print('%-10s %12s %12s %8s %8s %10s %10s %10s' % ('stage', 'target/sec', 'points/sec', 'errors', 'dropped',
+                                                    'p50, ms', 'p99, ms', 'p999, ms'))
+    for result in results:
+        latency = result['latency']
+        print('%-10s %12.0f %12.0f %8d %8d %10.1f %10.1f %10.1f' % (
+            result['stage'], result['target_rate'], result['rate'], result['errors'], result['dropped'],
+            (latency['p50'] or 0) * 1000, (latency['p99'] or 0) * 1000, (latency['p999'] or 0) * 1000))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
@@ -2,15 +2,129 @@ __author__ = 'Yury A. Kolotovichev'
 
 from time import time
 from random import random, randint
-from datetime import datetime
+from datetime import datetime, date
+from itertools import chain
+from functools import lru_cache
 import gzip
 import logging
+import re
+import threading
+from Influxdb.exceptions import ContainerFullError
 
+try:
+    import numpy as np
+except ImportError:  # numpy is optional, it is required by encode_columns only
+    np = None
 
 
 
 
 
+
+_EPOCH = datetime(1970, 1, 1)
+_EPOCH_ORDINAL = _EPOCH.toordinal()
+_iso_datetime = re.compile(r'(\d{4})-(\d\d)-(\d\d)[T ](\d\d):(\d\d):(\d\d)(?:\.(\d{1,9}))?Z?$')
+
+
+def _iso_datetime_to_nanoseconds(datetime_string):
+    """
+    Fast path for ISO-8601 datetime strings ('YYYY-MM-DD HH:MM:SS[.fffffffff]', 'T' separator allowed)
+    :return: nanoseconds since epoch or None if the string is not ISO-8601
+    """
+
+    match = _iso_datetime.match(datetime_string)
+    if match is None:
+        return None
+
+    year, month, day, hour, minute, second, fraction = match.groups()
+    hour, minute, second = int(hour), int(minute), int(second)
+    if hour > 23 or minute > 59 or second > 59:
+        return None
+    try:
+        days = date(int(year), int(month), int(day)).toordinal() - _EPOCH_ORDINAL
+    except ValueError:
+        return None
+
+    nanoseconds = (((days * 24 + hour) * 60 + minute) * 60 + second) * 10**9
+    if fraction:
+        nanoseconds += int(fraction.ljust(9, '0'))
+    return nanoseconds
+
+
+# line protocol escaping: measurement names escape commas and spaces; tag keys, tag values and field keys
+# escape equal signs as well; string field values escape double quotes and backslashes
+_name_escapes = str.maketrans({',': r'\,', ' ': r'\ '})
+_key_escapes = str.maketrans({',': r'\,', '=': r'\=', ' ': r'\ '})
+_string_escapes = str.maketrans({'"': r'\"', '\\': r'\\'})
+
+
+@lru_cache(maxsize=10000)
+def _escape_name(name):
+    return name.translate(_name_escapes)
+
+
+@lru_cache(maxsize=100000)
+def _escape_key(key):
+    """
+    Escaped tag key, tag value or field key
+    """
+    return str(key).translate(_key_escapes)
+
+
+def _string_field(value):
+    return '"%s"' % value.translate(_string_escapes)
+
+
+def _bool_field(value):
+    return 'true' if value else 'false'
+
+
+def _field_kind(kind, float_pattern):
+    """
+    :param kind: type of a field value
+    :return: format placeholder and converter of the value (None if not needed)
+    """
+
+    if issubclass(kind, bool) or (np is not None and issubclass(kind, np.bool_)):
+        return '%s', _bool_field
+    if issubclass(kind, int) or (np is not None and issubclass(kind, np.integer)):
+        return '%di', None
+    if issubclass(kind, str):
+        return '%s', _string_field
+    return float_pattern, None  # float, numpy floating, Decimal, ...
+
+
+@lru_cache(maxsize=10000)
+def _fields_template(keys, kinds, decimals):
+    """
+    Line protocol template of fields with given keys and value types, built once per field set
+    :return: template and tuple of value converters (None if no value needs conversion)
+    """
+
+    float_pattern = '%%.%df' % decimals
+    parts = []
+    converters = []
+    for key, kind in zip(keys, kinds):
+        placeholder, converter = _field_kind(kind, float_pattern)
+        parts.append(_escape_key(key).replace('%', '%%') + '=' + placeholder)
+        converters.append(converter)
+    return ','.join(parts), tuple(converters) if any(converters) else None
+
+
+def _encode_fields(fields, decimals):
+    """
+    Fields part of line protocol: floats with given decimals, integers with 'i' suffix,
+    booleans as true/false, strings quoted and escaped
+    """
+
+    values = tuple(fields.values())
+    template, converters = _fields_template(tuple(fields), tuple(map(type, values)), decimals)
+    if converters is not None:
+        values = tuple([value if converter is None else converter(value)
+                        for converter, value in zip(converters, values)])
+    return template % values
+
+
 # line protocol
 class Measurement:
     """
@@ -30,46 +144,57 @@ class Measurement:
         else:
             self.timestamp = ''
 
+    datetime_patterns = ('%d.%m.%Y %H:%M:%S',
+                         '%Y-%m-%d %H:%M:%S',
+                         '%Y-%m-%d %H:%M:%S.%f',
+                         '%Y-%m-%dT%H:%M:%S',
+                         '%Y-%m-%dT%H:%M:%S.%f')
+    _last_pattern = datetime_patterns[0]  # pattern matched last time is tried first
+
+    # number of nanoseconds in a unit of precision
+    precision_multipliers = {'n': 1, 'u': 10**3, 'ms': 10**6, 's': 10**9, 'm': 60 * 10**9, 'h': 3600 * 10**9}
+
     @staticmethod
     def _datetime_string_to_epoch(datetime_string, precision):
         """
-        Private method to convert datetime string to Unix epoch
+        Private method to convert datetime string to Unix epoch (integer, exact up to nanoseconds)
         """
 
         if datetime_string:
-            patterns = ('%d.%m.%Y %H:%M:%S',
-                        '%Y-%m-%d %H:%M:%S',
-                        '%Y-%m-%d %H:%M:%S.%f',
-                        '%Y-%m-%dT%H:%M:%S',
-                        '%Y-%m-%dT%H:%M:%S.%f')
-            precision_multipliers = {'n': 1e+9, 'u': 1e+6, 'ms': 1e+3, 's': 1, 'm': 1/60, 'h': 1/3600}
-            for pattern in patterns:
-                try:
-                    epoch = ((datetime.strptime(datetime_string, pattern) - datetime(1970, 1, 1)).total_seconds()) *\
-                        precision_multipliers[precision]
-                    return epoch
-                except ValueError:
-                    pass
+            nanoseconds = _iso_datetime_to_nanoseconds(datetime_string)
+
+            if nanoseconds is None:
+                last_pattern = Measurement._last_pattern
+                for pattern in (last_pattern, ) + Measurement.datetime_patterns:
+                    try:
+                        delta = datetime.strptime(datetime_string, pattern) - _EPOCH
+                    except ValueError:
+                        continue
+                    if pattern != last_pattern:
+                        Measurement._last_pattern = pattern
+                    nanoseconds = (delta.days * 86400 + delta.seconds) * 10**9 + delta.microseconds * 1000
+                    break
+                else:
+                    return None
+
+            return nanoseconds // Measurement.precision_multipliers[precision]
 
     def to_string(self, decimals=3):
         """
         Influxdb line protocol string representation
         """
 
-        # Making tags string representation
-        tags_rep = ''
-        if self.tags:
-            tags_rep = ',' + ','.join(['%s=%s' % (k, v) for k, v in self.tags.items()])
+        # Making escaped 'name,tags' representation (cached per series)
+        key = _series_key(self.name, tuple(self.tags.items()) if self.tags else None)
 
         # Making fields string representation
-        pattern = '%%s=%%.%df' % decimals
-        fields_rep = ",".join([pattern % (k, v) for k, v in self.fields.items()])
+        fields_rep = _encode_fields(self.fields, decimals)
 
         # Combining representations in a form of 'line protocol'
         if self.timestamp:
-            str_rep = '%s%s %s %d\n' % (self.name, tags_rep, fields_rep, self.timestamp)
+            str_rep = '%s %s %d\n' % (key, fields_rep, self.timestamp)
         else:
-            str_rep = '%s%s %s\n' % (self.name, tags_rep, fields_rep)
+            str_rep = '%s %s\n' % (key, fields_rep)
 
         return str_rep
 
@@ -86,6 +211,84 @@ class Measurement:
         return self.to_string().strip()
 
 
+@lru_cache(maxsize=100000)
+def _series_key(name, tag_items):
+    """
+    Escaped 'name,tag=value,...' prefix of line protocol, computed once per series
+    """
+    if not tag_items:
+        return _escape_name(name)
+    return _escape_name(name) + ',' + ','.join([_escape_key(k) + '=' + _escape_key(v) for k, v in tag_items])
+
+
+class Point:
+    """
+    Memory-lean counterpart of Measurement. Serializes byte-identically to Measurement,
+    but keeps no instance dict and shares the precompiled series key between points of a series
+    """
+
+    __slots__ = ('name', 'tags', 'fields', 'timestamp', 'key')
+
+    def __init__(self, name, fields, tags=None, timestamp=None, time_precision='n', key=None):
+        """
+        :param key: precompiled series key (see Series), computed from name and tags if not given
+        """
+        self.name = name
+        self.tags = tags
+        self.fields = fields
+
+        if isinstance(timestamp, str):
+            self.timestamp = Measurement._datetime_string_to_epoch(timestamp, time_precision)
+        else:
+            self.timestamp = timestamp
+
+        if key is None:
+            key = _series_key(name, tuple(tags.items()) if tags else None)
+        self.key = key
+
+    def to_string(self, decimals=3):
+        """
+        Influxdb line protocol string representation
+        """
+
+        fields_rep = _encode_fields(self.fields, decimals)
+
+        if self.timestamp:
+            return '%s %s %d\n' % (self.key, fields_rep, self.timestamp)
+        return '%s %s\n' % (self.key, fields_rep)
+
+    def to_bytes(self, decimals=3):
+        """
+        Influxdb line protocol in a form of bytes
+        """
+        return self.to_string(decimals).encode()
+
+    def __repr__(self):
+        return self.to_string()
+
+    def __str__(self):
+        return self.to_string().strip()
+
+
+class Series:
+    """
+    Point factory for a single series: name and tags are joined into the series key only once
+    """
+
+    __slots__ = ('name', 'tags', 'key')
+
+    def __init__(self, name, tags=None):
+        self.name = name
+        self.tags = tags
+        self.key = _series_key(name, tuple(tags.items()) if tags else None)
+
+    def point(self, fields, timestamp=None, time_precision='n'):
+        return Point(self.name, fields, self.tags, timestamp, time_precision, key=self.key)
+
+    def __repr__(self):
+        return 'Series: %s' % self.key
+
+
 class Container:
 
     def __init__(self, *measurements):
@@ -109,31 +312,288 @@ class Container:
         return 'Contains: %d Measurements' % len(self.points)
 
 
+class BoundedContainer:
+    """
+    Memory-bounded counterpart of Container. Points are encoded into a single reusable buffer as they are
+    appended, dump streams the buffer in line-aligned chunks and frees space as chunks are consumed.
+    When the limit is reached, producers are blocked (or rejected) until a dump makes room
+    """
+
+    def __init__(self, max_points=100000, max_bytes=16*1024*1024, decimals=3, block=True, timeout=None):
+        """
+        :param max_points: maximum number of buffered points
+        :param max_bytes: maximum size of buffered line protocol (bytes)
+        :param decimals: number of decimals in line protocol representation
+        :param block: wait for free space when full, otherwise raise ContainerFullError at once
+        :param timeout: maximum wait for free space (seconds), ContainerFullError is raised after it
+        :return:
+        """
+        self.max_points = max_points
+        self.max_bytes = max_bytes
+        self.decimals = decimals
+        self.block = block
+        self.timeout = timeout
+
+        self.buffer = bytearray()
+        self.npoints = 0
+        self._not_full = threading.Condition()
+
+    def _full(self, npoints, nbytes):
+        # an oversized append into an empty container is let through, otherwise it could never succeed
+        return self.npoints and (self.npoints + npoints > self.max_points or
+                                 len(self.buffer) + nbytes > self.max_bytes)
+
+    def append(self, *measurements):
+        """
+        Encodes and buffers points, Measurement-like objects (with to_bytes) or line protocol bytes.
+        Points of a single call are buffered all together
+        """
+
+        lines = b''.join([m if isinstance(m, (bytes, bytearray)) else m.to_bytes(decimals=self.decimals)
+                          for m in measurements])
+        npoints = lines.count(b'\n')
+        with self._not_full:
+            if self._full(npoints, len(lines)):
+                if not self.block:
+                    raise ContainerFullError('Container is full: %d points, %d bytes' %
+                                             (self.npoints, len(self.buffer)))
+                if not self._not_full.wait_for(lambda: not self._full(npoints, len(lines)), self.timeout):
+                    raise ContainerFullError('No room in container for %.1f seconds' % self.timeout)
+            self.buffer.extend(lines)
+            self.npoints += npoints
+
+    def dump(self, chunk_size=64*1024):
+        """
+        Streams points buffered by the time of the call, suitable for chunked POST.
+        Space of a chunk is freed when the next one is requested (i.e. the chunk is sent)
+        :param chunk_size: approximate chunk size (bytes), chunks are cut on line boundaries
+        :return: generator of line protocol chunks (bytes)
+        """
+
+        with self._not_full:
+            remaining = len(self.buffer)
+
+        while remaining:
+            with self._not_full:
+                end = self.buffer.rfind(b'\n', 0, min(chunk_size, remaining)) + 1
+                if not end:  # line longer than chunk_size
+                    end = self.buffer.find(b'\n', 0, remaining) + 1 or remaining
+                chunk = bytes(self.buffer[:end])
+
+            yield chunk
+
+            with self._not_full:
+                del self.buffer[:end]  # cheap: bytearray moves its start instead of copying the tail
+                self.npoints -= chunk.count(b'\n')
+                self._not_full.notify_all()
+            remaining -= end
+
+    def __len__(self):
+        return self.npoints
+
+    def __str__(self):
+        return 'Contains: %d points (%d bytes) of max %d points (%d bytes)' % (self.npoints, len(self.buffer),
+                                                                               self.max_points, self.max_bytes)
+
+
+class SeriesBatch:
+    """
+    Batch builder producing server-friendly payloads: tags are sorted by key, lines are grouped
+    by series key and ordered by ascending timestamp within a series.
+    Accepts Measurement and Point objects (anything with name, tags, fields and timestamp)
+    """
+
+    def __init__(self, *measurements):
+        self.series = {}  # series key -> list of (timestamp, fields)
+        self.npoints = 0
+        self.append(*measurements)
+
+    def append(self, *measurements):
+        for measurement in measurements:
+            tags = measurement.tags
+            key = _series_key(measurement.name, tuple(sorted(tags.items())) if tags else None)
+            points = self.series.get(key)
+            if points is None:
+                points = self.series[key] = []
+            points.append((measurement.timestamp, measurement.fields))
+        self.npoints += len(measurements)
+
+    def dump(self, decimals=3):
+        array = bytearray()
+        for key in sorted(self.series):
+            points = self.series[key]
+            # points without timestamp get the server time on arrival, so they go last
+            points.sort(key=lambda point: point[0] or float('inf'))
+            for timestamp, fields in points:
+                if timestamp:
+                    array.extend(('%s %s %d\n' % (key, _encode_fields(fields, decimals), timestamp)).encode())
+                else:
+                    array.extend(('%s %s\n' % (key, _encode_fields(fields, decimals))).encode())
+        return array
+
+    def clear(self):
+        self.series = {}
+        self.npoints = 0
+
+    def __len__(self):
+        return self.npoints
+
+    def __str__(self):
+        return 'Contains: %d points of %d series' % (self.npoints, len(self.series))
+
+
+
+def encode_columns(name, fields, timestamps=None, tags=None, decimals=3, chunk_size=100000):
+    """
+    Vectorized line protocol encoder for columnar (NumPy) data.
+    Output is byte-identical to Measurement.to_bytes of every row joined together
+    (integer arrays are written as integer fields, boolean arrays as booleans, string arrays as strings,
+    values of object arrays are written by their own types). If all fields and tags are scalars and there
+    are no timestamps, a single point is encoded
+    :param name: time series name
+    :param fields: dict of field name -> array (or scalar)
+    :param timestamps: array of epoch timestamps or None
+    :param tags: dict of tag name -> array (or scalar)
+    :param decimals: number of decimals in line protocol representation
+    :param chunk_size: number of rows formatted at once
+    :return: line protocol bytes
+    """
+
+    if np is None:
+        raise ImportError('numpy is required by encode_columns')
+
+    # Line template is formatted for all rows of a chunk in a single '%' operation.
+    # Scalars are baked into the template, arrays become row placeholders
+    columns = []
+    sizes = []  # (column description, number of rows)
+    float_pattern = '%%.%df' % decimals
+
+    def escaped(column, escape):
+        # escaping is done once per distinct value
+        unique, inverse = np.unique(column, return_inverse=True)
+        return np.array([escape(value) for value in unique.tolist()], dtype=object)[inverse]
+
+    def tag(key, value):
+        if np.ndim(value) == 0:
+            return _escape_key(key).replace('%', '%%') + '=' + _escape_key(value).replace('%', '%%')
+        sizes.append(('tag <%s>' % key, len(value)))
+        key = _escape_key(key).replace('%', '%%')
+        columns.append(escaped(np.asarray(value), _escape_key))
+        return key + '=%s'
+
+    def field(key, value):
+        if np.ndim(value) == 0:
+            placeholder, converter = _field_kind(type(value), float_pattern)
+            return _escape_key(key).replace('%', '%%') + '=' + \
+                (placeholder % (value if converter is None else converter(value))).replace('%', '%%')
+        sizes.append(('field <%s>' % key, len(value)))
+        key = _escape_key(key).replace('%', '%%')
+        column = np.asarray(value)
+        if column.dtype.kind == 'b':
+            columns.append(np.where(column, 'true', 'false'))
+            return key + '=%s'
+        if column.dtype.kind in 'iu':
+            columns.append(column)
+            return key + '=%di'
+        if column.dtype.kind in 'US':
+            columns.append(escaped(column.astype(str), _string_field))
+            return key + '=%s'
+        if column.dtype.kind == 'O':
+            # mixed values are encoded one by one, each as Measurement encodes its type
+            encoded = []
+            for value in column.tolist():
+                placeholder, converter = _field_kind(type(value), float_pattern)
+                encoded.append(placeholder % (value if converter is None else converter(value)))
+            columns.append(np.array(encoded, dtype=object))
+            return key + '=%s'
+        columns.append(column)
+        return key + '=' + float_pattern
+
+    head = _escape_name(name).replace('%', '%%')
+    if tags:
+        head += ',' + ','.join([tag(k, v) for k, v in tags.items()])
+    fields_rep = ','.join([field(k, v) for k, v in fields.items()])
+
+    if timestamps is not None:
+        sizes.append(('timestamps', len(timestamps)))
+    nrows = sizes[0][1] if sizes else 1  # all values are scalars: a single point
+    for column, size in sizes:
+        if size != nrows:
+            raise ValueError('Length of %s is %d, expected %d as of %s' % (column, size, nrows, sizes[0][0]))
+    line = '%s %s' % (head, fields_rep)
+
+    if timestamps is not None:
+        timestamps = np.asarray(timestamps)
+        columns.append(timestamps)
+        if not timestamps.all():
+            # rows with zero timestamp are written without it, as Measurement does
+            return _encode_rows_by_template(line, columns, timestamps, nrows)
+        line += ' %d'
+    line += '\n'
+
+    chunks = []
+    for start in range(0, nrows, chunk_size):
+        stop = min(start + chunk_size, nrows)
+        values = tuple(chain.from_iterable(zip(*[column[start:stop].tolist() for column in columns])))
+        chunks.append(((line * (stop - start)) % values).encode())
+    return b''.join(chunks)
+
+
+def _encode_rows_by_template(line, columns, timestamps, nrows):
+    """
+    Slow path of encode_columns for data with missing (zero) timestamps
+    """
+
+    with_timestamp = line + ' %d\n'
+    without_timestamp = line + '\n'
+    rows = zip(*[column.tolist() for column in columns])
+    lines = []
+    for row, timestamp in zip(rows, timestamps.tolist()):
+        if timestamp:
+            lines.append(with_timestamp % row)
+        else:
+            lines.append(without_timestamp % row[:-1])
+    return ''.join(lines).encode()
+
 
 class DummyPoints:
     """
     Dummy points generator. Useful for unit testing.
     """
 
-    def __init__(self, name,  npoints=1, decimals=3, delta_seconds=1, opt='one_point_per_series'):
+    def __init__(self, name,  npoints=1, decimals=3, delta_seconds=1, opt='one_point_per_series',
+                 tags=None, nfields=3, chunk_size=100000, seed=None):
         """
         :param name: time series name
         :param npoints: number of points to generate
         :param decimals: number of decimals in line protocol representation
         :param delta_seconds: time delta (in seconds) of sequential points
+        :param opt: 'one_point_per_series', 'single_series' (a line per item)
+                    or 'chunks' (vectorized, requires numpy, chunk_size lines per item)
+        :param tags: 'chunks' only: dict of tag name -> number of its values, series cardinality is their product
+        :param nfields: 'chunks' only: number of float fields per point
+        :param chunk_size: 'chunks' only: number of points per generated chunk
+        :param seed: 'chunks' only: seed of values and start time, output is deterministic if given
         :return:
         """
         self.name = name
         self.npoints = npoints
         self.decimals = decimals
         self.delta_seconds = delta_seconds
-        self.start_epoch = randint(1e+9, int(time()*1e+9))
         self.opt = opt
+        self.tags = tags if tags is not None else {'sensor': 100}
+        self.nfields = nfields
+        self.chunk_size = chunk_size
+        self.seed = seed
+        if seed is None:
+            self.start_epoch = randint(1e+9, int(time()*1e+9))
+        else:
+            self.start_epoch = 1388399803567000000 + seed * 10**9
 
     def generate(self, opt):
         """
         Generates dummy points in form of Influxdb line protocol (bytes)
-        :return: point generator
+        :return: point generator ('chunks': generator of line protocol chunks)
         """
 
         if opt == 'single_series':
@@ -142,7 +602,6 @@ class DummyPoints:
                 m = Measurement(name=self.name,
                                 fields={'X': random() * -720.0, 'Y': random() * 720.0, 'T': random() * 30.0},
                                 timestamp=ts)
-                m.to_bytes(decimals=self.decimals)
 
                 yield m.to_bytes(decimals=self.decimals)
             self.start_epoch = ts + self.delta_seconds * 1e+9  # update start_epoch to make points consequent
@@ -153,10 +612,43 @@ class DummyPoints:
                 m = Measurement(name='%s_%d' % (self.name, i),
                                 fields={'X': random() * -720.0, 'Y': random() * 720.0, 'T': random() * 30.0},
                                 timestamp=start_epoch)
-                m.to_bytes(decimals=self.decimals)
 
                 yield m.to_bytes(decimals=self.decimals)
 
+        elif opt == 'chunks':
+            yield from self.generate_chunks()
+
+    def generate_chunks(self):
+        """
+        Vectorized generator: points of all series (every tag combination) in turn, each series
+        gets a point every delta_seconds. Values are random floats in [-720, 720)
+        :return: generator of line protocol chunks (bytes) of chunk_size points
+        """
+
+        if np is None:
+            raise ImportError('numpy is required by DummyPoints chunks mode')
+
+        rng = np.random.default_rng(self.seed)
+        keys = list(self.tags)
+        shape = [self.tags[key] for key in keys]
+        nseries = int(np.prod(shape)) if shape else 1
+        values = [np.array(['%s_%d' % (key, i) for i in range(cardinality)]) for key, cardinality in zip(keys, shape)]
+        fields = ['F%d' % i for i in range(self.nfields)]
+        delta = int(self.delta_seconds * 10**9)
+
+        for start in range(0, self.npoints, self.chunk_size):
+            index = np.arange(start, min(start + self.chunk_size, self.npoints), dtype=np.int64)
+            series = index % nseries
+            timestamps = self.start_epoch + index // nseries * delta
+            tags = {key: column[i] for key, column, i in zip(keys, values, np.unravel_index(series, shape))} \
+                if shape else None
+            random_values = rng.random((self.nfields, len(index))) * 1440.0 - 720.0
+            yield encode_columns(self.name, dict(zip(fields, random_values)), timestamps, tags=tags,
+                                 decimals=self.decimals)
+
+        # next generation continues where this one stopped
+        self.start_epoch += -(-self.npoints // nseries) * delta
+
     def dump(self, file='', compress=False):
         """
         Dumps content of the generator to memory or file: text or gzipped
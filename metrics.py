@@ -0,0 +1,233 @@
+__author__ = 'Yury A. Kolotovichev'
+
+import logging
+import threading
+from bisect import bisect_left
+from time import time
+from Influxdb.measurements import Measurement
+from Influxdb.exceptions import InfluxdbAPIRequestError
+
+
+# upper bounds of latency buckets (seconds): 100 microseconds .. ~3 minutes, 20% apart
+LATENCY_BOUNDS = tuple(1e-4 * 1.2 ** i for i in range(80))
+
+
+class Histogram:
+    """
+    Histogram with fixed buckets. Recording is a binary search and an increment,
+    percentiles are accurate to a bucket width
+    """
+
+    def __init__(self, bounds=LATENCY_BOUNDS):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)  # last bucket collects values over the largest bound
+        self.count = 0
+        self.sum = 0.0
+        self.min = None
+        self.max = None
+
+    def record(self, value):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.sum += value
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+
+    def merge(self, other):
+        for i, count in enumerate(other.counts):
+            self.counts[i] += count
+        self.count += other.count
+        self.sum += other.sum
+        if other.count:
+            self.min = other.min if self.min is None else min(self.min, other.min)
+            self.max = other.max if self.max is None else max(self.max, other.max)
+
+    def percentile(self, percent):
+        """
+        :param percent: 0..100
+        :return: upper bound of the bucket containing the percentile (max for the last bucket)
+        """
+
+        if not self.count:
+            return None
+        rank = percent / 100.0 * self.count
+        seen = 0
+        for i, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank and count:
+                return min(self.bounds[i], self.max) if i < len(self.bounds) else self.max
+        return self.max
+
+    @property
+    def mean(self):
+        return self.sum / self.count if self.count else None
+
+    def snapshot(self):
+        return {'count': self.count, 'mean': self.mean, 'min': self.min, 'max': self.max,
+                'p50': self.percentile(50), 'p90': self.percentile(90), 'p99': self.percentile(99),
+                'p999': self.percentile(99.9)}
+
+    def __repr__(self):
+        return 'Histogram: %d values' % self.count
+
+
+class MetricsSink:
+    """
+    Interface of InfluxDBClient metrics sink. Methods are called on the hot path and have to be cheap
+    """
+
+    def request(self, endpoint, seconds, bytes_sent, bytes_received):
+        """Completed HTTP request (any response code)"""
+
+    def retry(self, endpoint, error):
+        """Failed request is going to be retried"""
+
+    def error(self, endpoint, error):
+        """Request failed, exception is raised to the caller"""
+
+    def points_written(self, npoints):
+        """Points accepted by the server"""
+
+
+class ClientMetrics(MetricsSink):
+    """
+    In-memory metrics sink: latency histograms per endpoint, byte, point, retry and error counters
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._reset()
+
+    def reset(self):
+        with self._lock:
+            self._reset()
+
+    def _reset(self):
+        self.latency = {}  # endpoint -> Histogram
+        self.requests = {}
+        self.bytes_sent = {}
+        self.bytes_received = {}
+        self.retries = {}
+        self.errors = {}  # (endpoint, exception type name) -> count
+        self.points = 0
+        self.since = time()
+
+    def request(self, endpoint, seconds, bytes_sent, bytes_received):
+        with self._lock:
+            histogram = self.latency.get(endpoint)
+            if histogram is None:
+                histogram = self.latency[endpoint] = Histogram()
+            histogram.record(seconds)
+            self.requests[endpoint] = self.requests.get(endpoint, 0) + 1
+            self.bytes_sent[endpoint] = self.bytes_sent.get(endpoint, 0) + bytes_sent
+            self.bytes_received[endpoint] = self.bytes_received.get(endpoint, 0) + bytes_received
+
+    def retry(self, endpoint, error):
+        with self._lock:
+            self.retries[endpoint] = self.retries.get(endpoint, 0) + 1
+
+    def error(self, endpoint, error):
+        key = (endpoint, type(error).__name__)
+        with self._lock:
+            self.errors[key] = self.errors.get(key, 0) + 1
+
+    def points_written(self, npoints):
+        with self._lock:
+            self.points += npoints
+
+    def snapshot(self, reset=False):
+        """
+        :param reset: start a new interval after taking the snapshot
+        :return: dict of metrics per endpoint
+        """
+
+        with self._lock:
+            seconds = time() - self.since
+            snapshot = {'seconds': seconds, 'points': self.points,
+                        'points_per_second': self.points / seconds if seconds else 0.0, 'endpoints': {}}
+            for endpoint in set(self.requests) | set(self.retries) | set(key[0] for key in self.errors):
+                snapshot['endpoints'][endpoint] = {
+                    'requests': self.requests.get(endpoint, 0),
+                    'bytes_sent': self.bytes_sent.get(endpoint, 0),
+                    'bytes_received': self.bytes_received.get(endpoint, 0),
+                    'retries': self.retries.get(endpoint, 0),
+                    'errors': {name: count for (e, name), count in self.errors.items() if e == endpoint},
+                    'latency': self.latency[endpoint].snapshot() if endpoint in self.latency else None}
+            if reset:
+                self._reset()
+        return snapshot
+
+    def __repr__(self):
+        return 'ClientMetrics: %d requests, %d points' % (sum(self.requests.values()), self.points)
+
+
+class InfluxDBMetricsReporter(ClientMetrics):
+    """
+    Self-reporting metrics sink: every interval aggregated metrics are written into an InfluxDB database.
+    Reporting client should be a separate InfluxDBClient without metrics, otherwise reports measure themselves
+    """
+
+    def __init__(self, client, dbname, interval=10.0, measurement='influxdb_client', tags=None):
+        """
+        :param client: InfluxDBClient used to write reports
+        :param dbname: database for reports
+        :param interval: reporting interval (seconds)
+        :param measurement: name of reported series
+        :param tags: extra tags of reported series (host, application, ...)
+        :return:
+        """
+        super(InfluxDBMetricsReporter, self).__init__()
+        self.client = client
+        self.dbname = dbname
+        self.interval = interval
+        self.measurement = measurement
+        self.tags = tags or {}
+
+        self._stop = threading.Event()
+        self._reporter = threading.Thread(target=self._report_loop, name='InfluxDBMetricsReporter', daemon=True)
+        self._reporter.start()
+
+    def measurements(self, snapshot):
+        """
+        :return: list of Measurement objects, one per endpoint
+        """
+
+        timestamp = int(time()) * 10**9
+        points = []
+        for endpoint, metrics in snapshot['endpoints'].items():
+            fields = {'requests': metrics['requests'], 'bytes_sent': metrics['bytes_sent'],
+                      'bytes_received': metrics['bytes_received'], 'retries': metrics['retries'],
+                      'errors': sum(metrics['errors'].values())}
+            latency = metrics['latency']
+            if latency:
+                for key in ('mean', 'min', 'max', 'p50', 'p90', 'p99'):
+                    fields['latency_%s' % key] = latency[key]
+            if endpoint == 'write':
+                fields['points'] = snapshot['points']
+                fields['points_per_second'] = snapshot['points_per_second']
+            tags = dict(self.tags, endpoint=endpoint)
+            points.append(Measurement(name=self.measurement, fields=fields, tags=tags, timestamp=timestamp))
+        return points
+
+    def report(self):
+        points = self.measurements(self.snapshot(reset=True))
+        if points:
+            self.client.write(dbname=self.dbname, points=b''.join(point.to_bytes(decimals=6) for point in points),
+                              precision='n')
+
+    def _report_loop(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.report()
+            except InfluxdbAPIRequestError as err:
+                logging.error('Metrics report failed: %s' % err)
+
+    def close(self):
+        """
+        Stops reporting, metrics collected since the last report are reported
+        """
+        self._stop.set()
+        self._reporter.join()
+        self.report()
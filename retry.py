@@ -0,0 +1,82 @@
+__author__ = 'Yury A. Kolotovichev'
+
+from random import uniform
+from time import time
+from email.utils import parsedate_to_datetime
+from Influxdb.exceptions import InfluxdbAPICodeMismatchError, InfluxdbAPITimeoutError, InfluxdbAPIConnectionError
+
+
+class RetryPolicy:
+    """
+    Retry policy of InfluxDBClient requests: exponential backoff with full jitter,
+    Retry-After of overload responses is honored
+    """
+
+    def __init__(self, max_retries=3, backoff_base=0.5, backoff_max=30.0, retry_codes=(429, 502, 503, 504),
+                 retry_timeouts=True, retry_connection_errors=True):
+        """
+        :param max_retries: number of retries after the first attempt
+        :param backoff_base: backoff of the first retry (seconds), doubled with every next retry
+        :param backoff_max: backoff limit (seconds), Retry-After is capped by it as well
+        :param retry_codes: response codes worth retrying (server overloaded or temporarily unavailable)
+        :param retry_timeouts: retry requests which timed out
+        :param retry_connection_errors: retry requests which failed to connect or lost connection
+        :return:
+        """
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.retry_codes = retry_codes
+        self.retry_timeouts = retry_timeouts
+        self.retry_connection_errors = retry_connection_errors
+
+    def should_retry(self, attempt, error):
+        """
+        :param attempt: number of the failed attempt, starting from 0
+        :param error: exception raised by the attempt
+        """
+
+        if attempt >= self.max_retries:
+            return False
+        if isinstance(error, InfluxdbAPICodeMismatchError):
+            return error.code_received in self.retry_codes
+        if isinstance(error, InfluxdbAPITimeoutError):
+            return self.retry_timeouts
+        if isinstance(error, InfluxdbAPIConnectionError):
+            return self.retry_connection_errors
+        return False
+
+    def delay(self, attempt, retry_after=None):
+        """
+        :param attempt: number of the failed attempt, starting from 0
+        :param retry_after: value of Retry-After header of the response, if any
+        :return: seconds to wait before the next attempt
+        """
+
+        seconds = parse_retry_after(retry_after)
+        if seconds is not None:
+            # small jitter keeps clients told the same Retry-After from coming back in lockstep
+            return min(seconds, self.backoff_max) + uniform(0, self.backoff_base)
+        return uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+
+    def __repr__(self):
+        return 'RetryPolicy: %d retries, backoff %.3f..%.3f seconds' % (self.max_retries, self.backoff_base,
+                                                                         self.backoff_max)
+
+
+def parse_retry_after(value):
+    """
+    :param value: Retry-After header: delay in seconds or HTTP date
+    :return: seconds or None
+    """
+
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time())
+    except (TypeError, ValueError):
+        return None
@@ -0,0 +1,216 @@
+__author__ = 'Yury A. Kolotovichev'
+
+import os
+import json
+import shutil
+import struct
+import logging
+import threading
+
+
+# record: header (magic, meta length, payload length), meta (write parameters, JSON), payload (line protocol)
+RECORD_HEADER = struct.Struct('>4sII')
+RECORD_MAGIC = b'ISPL'
+SEGMENT_SUFFIX = '.spool'
+POSITION_FILE = 'position'
+
+
+class WriteSpool:
+    """
+    Durable on-disk spool of failed writes. Batches are appended to segmented append-only files
+    and replayed in order by a background thread once the server is reachable again
+    """
+
+    def __init__(self, directory, segment_size=64*1024*1024, replay_interval=5.0, fsync=False):
+        """
+        :param directory: spool directory, created if it does not exist. Spooled data survives restarts
+        :param segment_size: segment file is sealed when it grows over this size (bytes)
+        :param replay_interval: delay between replay attempts (seconds)
+        :param fsync: fsync every appended batch (durable against power loss, but slower)
+        :return:
+        """
+        self.directory = directory
+        self.segment_size = segment_size
+        self.replay_interval = replay_interval
+        self.fsync = fsync
+
+        os.makedirs(directory, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._replay_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._replayer = None
+
+        self._segment = None  # segment file opened for appending
+        self._segment_number = 0
+        self.pending = 0  # number of batches waiting for replay
+
+        segments = self._segments()
+        if segments:
+            self._segment_number = int(segments[-1][:-len(SEGMENT_SUFFIX)])
+            position = self._read_position()
+            for segment in segments:
+                offset = position[1] if position and position[0] == segment else 0
+                self.pending += sum(1 for _ in self._records(segment, offset, read_payload=False))
+            if self.pending:
+                logging.warning('Spool <%s>: %d batches left from previous run' % (directory, self.pending))
+
+    def _segments(self):
+        return sorted(name for name in os.listdir(self.directory) if name.endswith(SEGMENT_SUFFIX))
+
+    def _path(self, name):
+        return os.path.join(self.directory, name)
+
+    def _read_position(self):
+        try:
+            with open(self._path(POSITION_FILE)) as f:
+                segment, offset = f.read().split()
+                return segment, int(offset)
+        except (IOError, ValueError):
+            return None
+
+    def _write_position(self, segment, offset):
+        with open(self._path(POSITION_FILE), 'w') as f:
+            f.write('%s %d' % (segment, offset))
+
+    def append(self, params, payload):
+        """
+        Appends a batch to the spool
+        :param params: write parameters (JSON serializable dict)
+        :param payload: line protocol bytes or binary file object (copied from its current position)
+        """
+
+        meta = json.dumps(params).encode()
+        if hasattr(payload, 'read'):
+            start = payload.tell()
+            length = payload.seek(0, os.SEEK_END) - start
+            payload.seek(start)
+        else:
+            length = len(payload)
+        with self._lock:
+            if self._segment is None:
+                self._segment_number += 1
+                self._segment = open(self._path('%020d%s' % (self._segment_number, SEGMENT_SUFFIX)), 'ab')
+
+            self._segment.write(RECORD_HEADER.pack(RECORD_MAGIC, len(meta), length))
+            self._segment.write(meta)
+            if hasattr(payload, 'read'):
+                shutil.copyfileobj(payload, self._segment)
+            else:
+                self._segment.write(payload)
+            self._segment.flush()
+            if self.fsync:
+                os.fsync(self._segment.fileno())
+
+            if self._segment.tell() >= self.segment_size:
+                self._seal()
+            self.pending += 1
+
+        logging.debug('Spool <%s>: batch of %d bytes spooled' % (self.directory, length))
+
+    def _seal(self):
+        # closed segment becomes available for replay, next append opens a new one
+        if self._segment is not None:
+            self._segment.close()
+            self._segment = None
+
+    def _records(self, segment, offset=0, read_payload=True):
+        """
+        Reads records of a sealed segment
+        :return: generator of (offset of the next record, params, payload)
+        """
+
+        with open(self._path(segment), 'rb') as f:
+            f.seek(offset)
+            while True:
+                header = f.read(RECORD_HEADER.size)
+                if len(header) < RECORD_HEADER.size:
+                    break
+                magic, meta_length, payload_length = RECORD_HEADER.unpack(header)
+                if magic != RECORD_MAGIC:
+                    logging.error('Spool <%s>: segment %s is corrupted at offset %d' % (self.directory, segment,
+                                                                                       f.tell()))
+                    break
+                meta = f.read(meta_length)
+                if read_payload:
+                    payload = f.read(payload_length)
+                else:
+                    f.seek(payload_length, os.SEEK_CUR)
+                    payload = None
+                if len(meta) < meta_length or (read_payload and len(payload) < payload_length):
+                    logging.error('Spool <%s>: segment %s is truncated' % (self.directory, segment))
+                    break
+                yield f.tell(), json.loads(meta.decode()), payload
+
+    def replay(self, send):
+        """
+        Replays spooled batches in order until the spool is empty or a batch fails
+        :param send: callable(params, payload) -> True if the batch has been written
+        :return: number of batches replayed
+        """
+
+        with self._replay_lock:
+            with self._lock:
+                self._seal()
+                segments = self._segments()
+
+            replayed = 0
+            position = self._read_position()
+            for segment in segments:
+                offset = position[1] if position and position[0] == segment else 0
+                for offset, params, payload in self._records(segment, offset):
+                    if not send(params, payload):
+                        logging.warning('Spool <%s>: replay suspended, %d batches pending' %
+                                        (self.directory, self.pending))
+                        return replayed
+                    self._write_position(segment, offset)
+                    with self._lock:
+                        self.pending -= 1
+                    replayed += 1
+
+                os.remove(self._path(segment))
+                if os.path.exists(self._path(POSITION_FILE)):
+                    os.remove(self._path(POSITION_FILE))
+                position = None
+
+            if replayed:
+                logging.info('Spool <%s>: %d batches replayed' % (self.directory, replayed))
+            return replayed
+
+    def _replay_loop(self, send):
+        while not self._stop.wait(self.replay_interval):
+            if self.pending:
+                try:
+                    self.replay(send)
+                except Exception as err:
+                    logging.error('Spool <%s>: replay failed: %s' % (self.directory, err))
+
+    def start(self, send):
+        """
+        Starts background replaying
+        :param send: see replay
+        """
+
+        if self._replayer is None:
+            self._stop.clear()
+            self._replayer = threading.Thread(target=self._replay_loop, args=(send, ), name='WriteSpool-replayer',
+                                              daemon=True)
+            self._replayer.start()
+
+    def stop(self):
+        """
+        Stops background replaying and closes the segment. Pending batches stay on disk
+        """
+
+        if self._replayer is not None:
+            self._stop.set()
+            self._replayer.join()
+            self._replayer = None
+        with self._lock:
+            self._seal()
+
+    def __len__(self):
+        return self.pending
+
+    def __repr__(self):
+        return 'WriteSpool: <%s>, %d batches pending' % (self.directory, self.pending)
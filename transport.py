@@ -0,0 +1,220 @@
+__author__ = 'Yury A. Kolotovichev'
+
+import json
+import socket
+import threading
+import http.client
+from collections import deque
+from urllib.parse import urlsplit, urlencode
+from Influxdb.exceptions import InfluxdbAPIRequestError, InfluxdbAPITimeoutError, InfluxdbAPIConnectionError
+
+try:
+    import requests
+    import requests.adapters
+except ImportError:  # requests is optional, it is required by RequestsTransport only
+    requests = None
+
+
+class Transport:
+    """
+    HTTP transport of InfluxDBClient. Implementations raise InfluxdbAPITimeoutError, InfluxdbAPIConnectionError
+    or InfluxdbAPIRequestError on failures and return responses with status_code, headers, content, text,
+    json(), iter_lines() and close() (a subset of requests.Response)
+    """
+
+    def request(self, method, url, params=None, data=None, headers=None, timeout=None, stream=False):
+        """
+        :param params: query string parameters, None values are skipped
+        :param data: request body: bytes, str, file object or iterable of bytes (sent chunked)
+        :param stream: body of the response is read on demand (iter_lines), response has to be closed
+        """
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class RequestsTransport(Transport):
+    """
+    Transport on top of requests.Session
+    """
+
+    def __init__(self, pool_size=100, keep_alive=True):
+        """
+        :param pool_size: number of connections kept per host
+        :param keep_alive: reuse connections between requests
+        :return:
+        """
+
+        if requests is None:
+            raise ImportError('requests is required by RequestsTransport')
+
+        self.session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        if not keep_alive:
+            self.session.headers['Connection'] = 'close'
+
+    def request(self, method, url, params=None, data=None, headers=None, timeout=None, stream=False):
+        try:
+            return self.session.request(url=url, method=method, headers=headers, params=params, data=data,
+                                        timeout=timeout, stream=stream)
+        except requests.Timeout as err:
+            raise InfluxdbAPITimeoutError(str(err))
+        except requests.ConnectionError as err:
+            raise InfluxdbAPIConnectionError(str(err))
+        except requests.RequestException as err:
+            raise InfluxdbAPIRequestError(str(err))
+
+    def close(self):
+        self.session.close()
+
+
+class HTTPResponse:
+    """
+    Response of HTTPClientTransport
+    """
+
+    def __init__(self, response, release, stream=False):
+        self.raw = response
+        self.status_code = response.status
+        self.headers = response.headers  # case-insensitive get, as in requests
+        self._release = release
+        self._content = None
+        if not stream:
+            self._read()
+
+    def _read(self):
+        try:
+            self._content = self.raw.read()
+        except socket.timeout as err:
+            self._release(False)
+            raise InfluxdbAPITimeoutError(str(err))
+        except (OSError, http.client.HTTPException) as err:
+            self._release(False)
+            raise InfluxdbAPIConnectionError(str(err))
+        self._release(True)
+
+    @property
+    def content(self):
+        if self._content is None:
+            self._read()
+        return self._content
+
+    @property
+    def text(self):
+        return self.content.decode('utf-8', errors='replace')
+
+    def json(self):
+        return json.loads(self.content)
+
+    def iter_lines(self, chunk_size=512):
+        pending = b''
+        while True:
+            block = self.raw.read1(chunk_size)
+            if not block:
+                break
+            lines = (pending + block).split(b'\n')
+            pending = lines.pop()
+            yield from lines
+        if pending:
+            yield pending
+        self.raw.read()  # marks the response complete, so the connection can send the next request
+        self._content = b''
+        self._release(True)
+
+    def close(self):
+        if self._content is None:  # body is not read to the end, connection can't be reused
+            self._content = b''
+            self._release(False)
+
+    def __repr__(self):
+        return '<HTTPResponse [%d]>' % self.status_code
+
+
+class HTTPClientTransport(Transport):
+    """
+    Lean transport built directly on http.client: a pool of keep-alive connections per host,
+    no hooks, cookies, redirects or content decoding
+    """
+
+    def __init__(self, pool_size=100, keep_alive=True):
+        """
+        :param pool_size: number of idle connections kept per host
+        :param keep_alive: reuse connections between requests
+        :return:
+        """
+        self.pool_size = pool_size
+        self.keep_alive = keep_alive
+        self._idle = {}  # (scheme, host, port) -> deque of idle connections
+        self._lock = threading.Lock()
+
+    def _connection(self, key, timeout):
+        """
+        :return: connection and whether it was taken from the pool
+        """
+
+        with self._lock:
+            idle = self._idle.get(key)
+            if idle:
+                connection = idle.pop()
+                connection.timeout = timeout
+                if connection.sock is not None:
+                    connection.sock.settimeout(timeout)
+                return connection, True
+        scheme, host, port = key
+        connection_class = http.client.HTTPSConnection if scheme == 'https' else http.client.HTTPConnection
+        return connection_class(host, port, timeout=timeout), False
+
+    def _releaser(self, key, connection):
+        def release(reusable):
+            if reusable and self.keep_alive and connection.sock is not None:
+                with self._lock:
+                    idle = self._idle.setdefault(key, deque())
+                    if len(idle) < self.pool_size:
+                        idle.append(connection)
+                        return
+            connection.close()
+        return release
+
+    def request(self, method, url, params=None, data=None, headers=None, timeout=None, stream=False):
+        split = urlsplit(url)
+        path = split.path or '/'
+        if params:
+            query = urlencode([(k, v) for k, v in params.items() if v is not None])
+            if query:
+                path += '?' + query
+        if isinstance(data, str):
+            data = data.encode()
+        headers = dict(headers) if headers else {}
+        if not self.keep_alive:
+            headers['Connection'] = 'close'
+
+        key = (split.scheme, split.hostname, split.port or (443 if split.scheme == 'https' else 80))
+        # in-memory body can be sent again when a pooled connection turns out to be closed by the server
+        replayable = data is None or isinstance(data, (bytes, bytearray, memoryview))
+        while True:
+            connection, reused = self._connection(key, timeout)
+            try:
+                connection.request(method, path, body=data, headers=headers)
+                response = connection.getresponse()
+            except socket.timeout as err:
+                connection.close()
+                raise InfluxdbAPITimeoutError(str(err))
+            except (OSError, http.client.HTTPException) as err:
+                connection.close()
+                if reused and replayable and isinstance(err, (ConnectionResetError, BrokenPipeError)):
+                    continue  # pooled connection was closed by the server while idle
+                raise InfluxdbAPIConnectionError(str(err))
+            return HTTPResponse(response, self._releaser(key, connection), stream=stream)
+
+    def close(self):
+        with self._lock:
+            for idle in self._idle.values():
+                for connection in idle:
+                    connection.close()
+            self._idle.clear()
+
+
+transports = {'requests': RequestsTransport, 'http.client': HTTPClientTransport}
@@ -1,12 +1,42 @@
 __author__ = 'Yury A. Kolotovichev'
 
 import unittest
-from measurements import Measurement, DummyPoints, Container
-from influxdb import InfluxDBClient
-import multiprocessing
-from time import time
+from measurements import Measurement, DummyPoints, Container, Point, Series, SeriesBatch, BoundedContainer, \
+    encode_columns
+from influxdb import InfluxDBClient, QueryBatch, gzip_stream, line_slices
+from writer import BatchWriter
+from aioinfluxdb import AsyncInfluxDBClient
+from Influxdb.exceptions import InfluxdbAPIRequestError, InfluxdbAPICodeMismatchError, InfluxdbAPIConnectionError, \
+    ContainerFullError
+import asyncio
+import gzip
+import io
+import json
+import tempfile
+import threading
+import requests
+from bulkload import BulkLoader, iter_chunks
+from spool import WriteSpool
+from retry import RetryPolicy
+from cluster import InfluxDBClusterClient
+from metrics import ClientMetrics, Histogram
+from fakeserver import FakeInfluxDBServer
+import benchmarks
+from loadgen import LoadGenerator, Stage, parse_stages
+from cache import QueryCache
+from aggregation import WindowAggregator
+from deadband import DeadbandFilter
+from transport import Transport
+from time import time, sleep
+from urllib.parse import quote_plus
+from unittest import mock
 import logging
 
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
 
 class DBClientTest(unittest.TestCase):
 
@@ -61,6 +91,14 @@ class DBClientTest(unittest.TestCase):
         print('Single point query: ', q)
         self.assertEqual(q['results'][0]['series'][0]['values'][0][1], 30)
 
+    @unittest.skipIf(np is None, 'numpy is not installed')
+    def test_query_columnar(self):
+        self.dbclient.write(dbname=self.dbname, points=self.single_point.to_bytes(), precision='n')
+        q = self.dbclient.query(dbname=self.dbname, query='SELECT * FROM %s' % self.series, columnar=True)
+        columns = q['results'][0]['series'][0]['values']
+        self.assertEqual(columns['T'][0], 30)
+        self.assertEqual(columns['time'][0], self.single_point.timestamp)
+
     #@unittest.skip("Skipped")
     def test_write_in_memory_dumped_bytearray(self):
         # bytearray (or bytes, dumped in-memory) (non-chunked, not compressed)
@@ -99,6 +137,12 @@ class DBClientTest(unittest.TestCase):
         r = self.dbclient.write(dbname=self.dbname, points=self.dummies.dump(compress=True), precision='n', gzipped=True)
         self.assertEqual(r.status_code, 204)
 
+    #@unittest.skip("Skipped")
+    def test_write_compressed_on_the_fly(self):
+        # generator (chunked HTTP POST, compressed while sending)
+        r = self.dbclient.write(dbname=self.dbname, points=self.dummies, precision='n', compress=True)
+        self.assertEqual(r.status_code, 204)
+
     #@unittest.skip("Skipped")
     def test_bulk_write_into_single_series(self):
         dummies = DummyPoints(self.series, npoints=5000, decimals=4, delta_seconds=600, opt='single_series')
@@ -116,12 +160,6 @@ class DBClientTest(unittest.TestCase):
             r = self.dbclient.write(dbname=self.dbname, points=dummies.dump(), precision='n')
             self.assertEqual(r.status_code, 204)
 
-    def write_worker(self, npoints, nchunks):
-        for chunk in range(0, nchunks):
-            print('Sending chunk ', chunk)
-            dummies = DummyPoints(self.series, npoints=npoints, decimals=4, delta_seconds=6000, opt='one_point_per_series')
-            self.dbclient.write(dbname=self.dbname, points=dummies.dump(), precision='n')
-
     @unittest.skip("Skipped")
     def test_write_100000_points_in_10000_chunks_multiprocess(self):
 
@@ -129,15 +167,978 @@ class DBClientTest(unittest.TestCase):
         npoints = 1000
         nchunks = 10
 
-        workers = []
-        for i in range(nworkers):
-            p = multiprocessing.Process(target=self.write_worker, args=(), kwargs={'npoints': npoints,
-                                                                                   'nchunks': nchunks})
-            workers.append(p)
-            p.start()
+        dummies = DummyPoints(self.series, npoints=nworkers*nchunks*npoints, decimals=4, delta_seconds=6000,
+                              opt='one_point_per_series')
+        loader = BulkLoader(host=self.host, port=self.port, dbname=self.dbname, http_timeout=600,
+                            workers=nworkers, chunk_size=npoints, mode='process')
+        report = loader.load(dummies)
+        print(report)
+        self.assertEqual(report.failures, [])
+        self.assertEqual(report.points, nworkers*nchunks*npoints)
 
-        for p in workers:
-            p.join()
+
+class FakeClient:
+    """
+    Records write() calls instead of sending them to the server
+    """
+
+    def __init__(self):
+        self.writes = []
+
+    def write(self, dbname, points, **kwargs):
+        self.writes.append((dbname, points, kwargs))
+
+
+class BatchWriterTest(unittest.TestCase):
+
+    def setUp(self):
+        self.client = FakeClient()
+        self.point = Measurement(name='Tilt', fields={'X': -100, 'Y': 720.0, 'T': 30.0}, timestamp=1388399803567000000)
+
+    def test_flush_on_batch_size(self):
+        writer = BatchWriter(self.client, 'unittestdb', batch_size=3, max_age=None)
+        writer.append(self.point, self.point)
+        self.assertEqual(len(self.client.writes), 0)
+        writer.append(self.point)
+        self.assertEqual(len(self.client.writes), 1)
+        self.assertEqual(self.client.writes[0][1], self.point.to_bytes() * 3)
+        self.assertEqual(len(writer), 0)
+
+    def test_flush_on_max_age(self):
+        with BatchWriter(self.client, 'unittestdb', batch_size=1000, max_age=0.05) as writer:
+            writer.append(self.point)
+            sleep(0.3)
+            self.assertEqual(len(self.client.writes), 1)
+
+    def test_close_flushes_remaining_points(self):
+        with BatchWriter(self.client, 'unittestdb', batch_size=1000, max_age=60) as writer:
+            writer.append(self.point, self.point.to_bytes(decimals=4))
+        self.assertEqual(self.client.writes[0][1], self.point.to_bytes() + self.point.to_bytes(decimals=4))
+        self.assertRaises(ValueError, writer.append, self.point)
+
+    def test_failed_write_keeps_points(self):
+        refused = InfluxdbAPIConnectionError('refused')
+        self.client.write = mock.Mock(side_effect=[refused, refused, refused, None])
+        writer = BatchWriter(self.client, 'unittestdb', batch_size=2, max_age=None)
+        self.assertRaises(InfluxdbAPIConnectionError, writer.append, self.point, self.point)
+        self.assertEqual(len(writer), 2)
+        self.assertRaises(InfluxdbAPIConnectionError, writer.append, self.point.to_bytes(decimals=4))
+        self.assertRaises(InfluxdbAPIConnectionError, writer.close)
+        self.assertEqual(len(writer), 3)
+        self.assertEqual(writer.flush(), 3)
+        self.assertEqual(self.client.write.call_args[1]['points'],
+                         self.point.to_bytes() * 2 + self.point.to_bytes(decimals=4))
+        self.assertEqual(len(writer), 0)
+
+    def test_rejected_batch_is_dropped(self):
+        self.client.write = mock.Mock(side_effect=[InfluxdbAPICodeMismatchError('bad line', 400, (204, 500)),
+                                                   FakeResponse(500), None])
+        writer = BatchWriter(self.client, 'unittestdb', batch_size=1, max_age=None)
+        self.assertRaises(InfluxdbAPICodeMismatchError, writer.append, self.point)
+        self.assertEqual(len(writer), 0)  # never retried
+        self.assertRaises(InfluxdbAPICodeMismatchError, writer.append, self.point)
+        self.assertEqual(len(writer), 1)  # server failure, kept for retry
+        self.assertEqual(writer.flush(), 1)
+
+    def test_retained_points_are_bounded(self):
+        self.client.write = mock.Mock(side_effect=InfluxdbAPIConnectionError('refused'))
+        size = len(self.point.to_bytes())
+        writer = BatchWriter(self.client, 'unittestdb', batch_size=1, max_age=None, max_retained_bytes=size * 2)
+        self.assertRaises(InfluxdbAPIConnectionError, writer.append, self.point)
+        self.assertRaises(InfluxdbAPIConnectionError, writer.append, self.point)
+        self.assertEqual(len(writer), 2)
+        self.assertRaises(InfluxdbAPIConnectionError, writer.append, self.point)
+        self.assertEqual(len(writer), 0)  # three points don't fit, the failed batch is dropped
+
+
+class AsyncInfluxDBClientTest(unittest.TestCase):
+
+    def test_connection_error_raises_request_error(self):
+        async def write():
+            async with AsyncInfluxDBClient(host='127.0.0.1', port=1, http_timeout=5) as dbclient:
+                await dbclient.write(dbname='unittestdb', points=[b'Tilt X=1.000\n'], precision='n')
+
+        self.assertRaises(InfluxdbAPIRequestError, asyncio.run, write())
+
+    def test_concurrent_requests_against_fake_server(self):
+        points = [Measurement(name='Tilt', fields={'X': float(i)}, timestamp=1388399803567000000 + i).to_bytes()
+                  for i in range(20)]
+
+        async def run():
+            async with AsyncInfluxDBClient(host=server.host, port=server.port, http_timeout=5, pool_size=2) as dbclient:
+                responses = await asyncio.gather(*[dbclient.write(dbname='unittestdb', points=chunk, precision='n')
+                                                   for chunk in points])
+                result = await dbclient.query(dbname='unittestdb', query='SELECT X FROM Tilt')
+                server.fail_next(400)
+                with self.assertRaises(InfluxdbAPICodeMismatchError) as raised:
+                    await dbclient.write(dbname='unittestdb', points=points[0])
+            return responses, result, raised.exception
+
+        with FakeInfluxDBServer(store=True) as server:
+            server.query_results['SELECT X FROM Tilt'] = {'series': [{'name': 'Tilt', 'columns': ['time', 'X'],
+                                                                      'values': [[1, 2.0]]}]}
+            responses, result, error = asyncio.run(run())
+
+        self.assertEqual([r.status_code for r in responses], [204] * 20)
+        self.assertEqual(sorted(payload for dbname, payload in server.written), sorted(points))
+        self.assertEqual(result['results'][0]['series'][0]['values'], [[1, 2.0]])
+        self.assertEqual(error.code_received, 400)
+        self.assertLessEqual(server.connections, 2)  # requests are multiplexed over the bounded pool
+
+
+class BulkLoaderTest(unittest.TestCase):
+
+    def test_iter_chunks(self):
+        lines = [b'Tilt X=%d.000 %d\n' % (i, i) for i in range(10)]
+        chunks = list(iter_chunks(lines, 4))
+        self.assertEqual([(first_line, npoints) for first_line, npoints, _ in chunks], [(0, 4), (4, 4), (8, 2)])
+        self.assertEqual(b''.join(chunk for _, _, chunk in chunks), b''.join(lines))
+
+    @unittest.skipIf(np is None, 'numpy is not installed')
+    def test_iter_chunks_of_multiline_items(self):
+        dummies = list(DummyPoints('Tilt', npoints=250, opt='chunks', chunk_size=100))
+        chunks = list(iter_chunks(dummies, 60))
+        self.assertEqual([npoints for _, npoints, _ in chunks], [60, 60, 60, 60, 10])
+        self.assertEqual([chunk.count(b'\n') for _, _, chunk in chunks], [60, 60, 60, 60, 10])
+        self.assertEqual(b''.join(chunk for _, _, chunk in chunks), b''.join(dummies))
+
+    def test_thread_pool_load_reports_failed_chunks(self):
+        def write(client, points, **kwargs):
+            if b'Tilt_13 ' in points:
+                raise InfluxdbAPIRequestError()
+            return FakeResponse(204)
+
+        dummies = DummyPoints('Tilt', npoints=100, decimals=4)
+        loader = BulkLoader(host='127.0.0.1', port=8086, dbname='unittestdb', workers=4, chunk_size=10, mode='thread')
+        with mock.patch('bulkload.InfluxDBClient.write', write):
+            report = loader.load(dummies)
+
+        self.assertEqual(report.points, 100)
+        self.assertEqual(report.chunks, 10)
+        self.assertEqual([failure[:3] for failure in report.failures], [(1, 10, 10)])
+        self.assertEqual(report.failed_points, 10)
+
+    def test_chunks_answered_with_500_fail(self):
+        with FakeInfluxDBServer() as server:
+            server.fail_next(500, 3)
+            loader = BulkLoader(host=server.host, port=server.port, dbname='unittestdb', http_retries=0, workers=1,
+                                chunk_size=10, mode='thread')
+            report = loader.load(DummyPoints('Tilt', npoints=100, decimals=4))
+        self.assertEqual(len(report.failures), 3)
+        self.assertEqual(report.points - report.failed_points, server.points)
+
+    def test_concurrent_loaders_keep_their_settings(self):
+        with FakeInfluxDBServer() as first, FakeInfluxDBServer() as second:
+            loaders = [BulkLoader(host=server.host, port=server.port, dbname='unittestdb', workers=2, chunk_size=10,
+                                  mode='thread') for server in (first, second)]
+            threads = [threading.Thread(target=loader.load, args=(DummyPoints('Tilt', npoints=npoints, decimals=4), ))
+                       for loader, npoints in zip(loaders, (200, 300))]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        self.assertEqual((first.points, second.points), (200, 300))
+
+
+class DatetimeStringToEpochTest(unittest.TestCase):
+
+    def test_exact_integer_epoch(self):
+        to_epoch = Measurement._datetime_string_to_epoch
+        self.assertEqual(to_epoch('2013-12-30 10:36:43.567', 'n'), 1388399803567000000)
+        self.assertEqual(to_epoch('2013-12-30T10:36:43.123456789Z', 'n'), 1388399803123456789)
+        self.assertEqual(to_epoch('2013-12-30T10:36:43.123456', 'u'), 1388399803123456)
+        self.assertEqual(to_epoch('2013-12-30 10:36:43', 'ms'), 1388399803000)
+        self.assertEqual(to_epoch('2013-12-30 10:36:43', 'm'), 23139996)
+        self.assertEqual(to_epoch('2013-12-30 10:36:43', 'h'), 385666)
+        self.assertIsNone(to_epoch('2013-12-30 25:36:43', 'n'))
+
+    def test_non_iso_patterns(self):
+        to_epoch = Measurement._datetime_string_to_epoch
+        self.assertEqual(to_epoch('30.12.2013 10:36:43', 's'), 1388399803)
+        self.assertEqual(Measurement._last_pattern, '%d.%m.%Y %H:%M:%S')
+        self.assertEqual(to_epoch('2013-1-3 10:36:43', 's'), 1357209403)
+        self.assertEqual(Measurement._last_pattern, '%Y-%m-%d %H:%M:%S')
+
+
+class PointTest(unittest.TestCase):
+
+    def test_byte_identical_to_measurement(self):
+        kwargs = {'name': 'Tilt', 'fields': {'X': -100, 'Y': 720.0, 'T': 30.0}, 'tags': {'sensor': 'Tilt_1'},
+                  'timestamp': '2013-12-30 10:36:43.567'}
+        self.assertEqual(Point(**kwargs).to_bytes(decimals=4), Measurement(**kwargs).to_bytes(decimals=4))
+        del kwargs['tags'], kwargs['timestamp']
+        self.assertEqual(Point(**kwargs).to_bytes(), Measurement(**kwargs).to_bytes())
+
+    def test_series_shares_key(self):
+        series = Series('Tilt', tags={'sensor': 'Tilt_1', 'site': 'L1'})
+        point1 = series.point({'X': 1.0}, timestamp=1388399803567000000)
+        point2 = Point('Tilt', {'X': 2.0}, tags={'sensor': 'Tilt_1', 'site': 'L1'}, timestamp=1388399803568000000)
+        self.assertIs(point1.key, point2.key)
+        self.assertEqual(point1.to_bytes(), b'Tilt,sensor=Tilt_1,site=L1 X=1.000 1388399803567000000\n')
+        self.assertFalse(hasattr(point1, '__dict__'))
+
+    def test_escaping_and_field_types(self):
+        point = Point('cpu load', {'a b': 1, 'v': 1.5, 'ok': True, 's': 'say "hi" \\'}, tags={'host,dc': 'a=b c'},
+                      timestamp=1388399803567000000)
+        expected = b'cpu\\ load,host\\,dc=a\\=b\\ c a\\ b=1i,v=1.500,ok=true,s="say \\"hi\\" \\\\" 1388399803567000000\n'
+        self.assertEqual(point.to_bytes(), expected)
+        self.assertEqual(Measurement(point.name, point.fields, point.tags, point.timestamp).to_bytes(), expected)
+
+
+class BoundedContainerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.points = [Point('Tilt', {'X': float(i)}, timestamp=1388399803567000000 + i) for i in range(100)]
+
+    def test_streaming_dump(self):
+        container = BoundedContainer(max_points=1000)
+        container.append(*self.points)
+        chunks = list(container.dump(chunk_size=100))
+        self.assertEqual(b''.join(chunks), b''.join(point.to_bytes() for point in self.points))
+        self.assertTrue(all(chunk.endswith(b'\n') and len(chunk) <= 100 for chunk in chunks))
+        self.assertEqual((len(container), len(container.buffer)), (0, 0))
+
+    def test_full_container_rejects_or_blocks(self):
+        container = BoundedContainer(max_points=60, block=False)
+        container.append(*self.points[:50])
+        self.assertRaises(ContainerFullError, container.append, *self.points[50:])
+
+        container = BoundedContainer(max_points=60, timeout=5)
+        container.append(*self.points[:50])
+        producer = threading.Thread(target=container.append, args=self.points[50:])
+        producer.start()
+        producer.join(0.1)
+        self.assertTrue(producer.is_alive())  # blocked until the dump frees space
+        dumped = b''.join(container.dump(chunk_size=1000))
+        producer.join(5)
+        self.assertEqual(dumped.count(b'\n'), 50)
+        self.assertEqual(len(container), 50)
+        container.timeout = 0.05
+        self.assertRaises(ContainerFullError, container.append, *self.points[:20])
+
+    def test_oversized_append_into_empty_container(self):
+        container = BoundedContainer(max_points=10, block=False)
+        container.append(*self.points)
+        self.assertEqual(len(container), 100)
+
+
+@unittest.skipIf(np is None, 'numpy is not installed')
+class DummyPointsChunksTest(unittest.TestCase):
+
+    def test_deterministic_chunks(self):
+        kwargs = {'npoints': 1000, 'opt': 'chunks', 'tags': {'host': 5, 'region': 2}, 'nfields': 4,
+                  'chunk_size': 300, 'seed': 7}
+        chunks = list(DummyPoints('Tilt', **kwargs))
+        self.assertEqual([chunk.count(b'\n') for chunk in chunks], [300, 300, 300, 100])
+        self.assertEqual(b''.join(chunks), DummyPoints('Tilt', **kwargs).dump())
+
+        lines = b''.join(chunks).splitlines()
+        self.assertEqual(len(set(line.split(b' ')[0] for line in lines)), 10)
+        self.assertTrue(lines[0].startswith(b'Tilt,host=host_0,region=region_0 F0='))
+        self.assertEqual(lines[0].count(b'='), 6)
+
+
+class SeriesBatchTest(unittest.TestCase):
+
+    def test_lines_are_grouped_by_series_and_sorted(self):
+        batch = SeriesBatch(Measurement('Tilt', {'X': 3.0}, {'site': 'L1', 'sensor': 'B'}, 30),
+                            Point('Tilt', {'X': 1.0}, {'sensor': 'A', 'site': 'L1'}, 20),
+                            Measurement('Tilt', {'X': 2.0}, {'sensor': 'B', 'site': 'L1'}, 10),
+                            Measurement('Tilt', {'X': 4.0}, {'sensor': 'A', 'site': 'L1'}))
+        batch.append(Point('Tilt', {'X': 5.0}, {'sensor': 'A', 'site': 'L1'}, 5))
+        self.assertEqual(len(batch), 5)
+        self.assertEqual(bytes(batch.dump(decimals=1)),
+                         b'Tilt,sensor=A,site=L1 X=5.0 5\n'
+                         b'Tilt,sensor=A,site=L1 X=1.0 20\n'
+                         b'Tilt,sensor=A,site=L1 X=4.0\n'
+                         b'Tilt,sensor=B,site=L1 X=2.0 10\n'
+                         b'Tilt,sensor=B,site=L1 X=3.0 30\n')
+
+
+class GzipStreamTest(unittest.TestCase):
+
+    def setUp(self):
+        self.points = [DummyPoints('Tilt', npoints=100, decimals=4).dump() for _ in range(20)]
+
+    def test_generator(self):
+        compressed = b''.join(gzip_stream(iter(self.points)))
+        self.assertEqual(gzip.decompress(compressed), b''.join(self.points))
+
+    def test_file(self):
+        compressed = b''.join(gzip_stream(io.BytesIO(b''.join(self.points)), read_size=1000))
+        self.assertEqual(gzip.decompress(compressed), b''.join(self.points))
+
+
+class FakeResponse:
+    """
+    Stands for requests.Response in tests which do not need the server
+    """
+
+    def __init__(self, status_code=200, content=b'', lines=(), headers=None):
+        self.status_code = status_code
+        self.content = content
+        self.headers = headers or {}
+        self.text = content.decode()
+        self.lines = lines
+        self.closed = False
+
+    def json(self):
+        return json.loads(self.content)
+
+    def iter_lines(self, chunk_size=512):
+        return iter(self.lines)
+
+    def close(self):
+        self.closed = True
+
+
+class QueryChunkedTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dbclient = InfluxDBClient(host='127.0.0.1', port=8086)
+
+    def test_series_are_yielded_per_chunk(self):
+        chunks = [{'results': [{'series': [{'name': 'Tilt', 'columns': ['time', 'X'], 'values': [[1, 1.0], [2, 2.0]],
+                                            'partial': True}], 'partial': True}]},
+                  {'results': [{'series': [{'name': 'Tilt', 'columns': ['time', 'X'], 'values': [[3, 3.0]]}]}]}]
+        response = FakeResponse(lines=[json.dumps(chunk).encode() for chunk in chunks])
+
+        with mock.patch.object(self.dbclient.HTTPsession, 'request', return_value=response) as request:
+            series = list(self.dbclient.query_chunked('unittestdb', 'SELECT * FROM Tilt', chunk_size=2))
+
+        self.assertEqual([s['values'] for s in series], [[[1, 1.0], [2, 2.0]], [[3, 3.0]]])
+        self.assertEqual(request.call_args[1]['params']['chunked'], 'true')
+        self.assertTrue(request.call_args[1]['stream'])
+        self.assertTrue(response.closed)
+
+    def test_error_in_chunk(self):
+        response = FakeResponse(lines=[b'{"results": [{"error": "measurement not found"}]}'])
+        with mock.patch.object(self.dbclient.HTTPsession, 'request', return_value=response):
+            self.assertRaises(InfluxdbAPIRequestError, list, self.dbclient.query_chunked('unittestdb', 'SELECT 1'))
+
+
+class RetryPolicyTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dbclient = InfluxDBClient(host='127.0.0.1', port=8086,
+                                       retry_policy=RetryPolicy(max_retries=3, backoff_base=0.1, backoff_max=1.0))
+        self.points = b''.join(Measurement(name='Tilt', fields={'X': float(i)}, timestamp=i + 1).to_bytes()
+                               for i in range(10))
+
+    def test_backoff_with_jitter(self):
+        policy = RetryPolicy(backoff_base=0.5, backoff_max=4.0)
+        for attempt in range(6):
+            self.assertTrue(0 <= policy.delay(attempt) <= min(4.0, 0.5 * 2 ** attempt))
+        self.assertTrue(2.0 <= policy.delay(0, retry_after='2') <= 2.5)
+        self.assertTrue(4.0 <= policy.delay(0, retry_after='120') <= 4.5)
+
+    def test_connection_errors_and_overload_are_retried(self):
+        responses = [requests.ConnectionError(), FakeResponse(429, headers={'Retry-After': '0.5'}), FakeResponse(204)]
+        with mock.patch.object(self.dbclient.HTTPsession, 'request', side_effect=responses) as request, \
+                mock.patch('influxdb.sleep') as sleep:
+            self.assertEqual(self.dbclient.write('unittestdb', self.points).status_code, 204)
+        self.assertEqual(request.call_count, 3)
+        self.assertTrue(sleep.call_args_list[1][0][0] >= 0.5)
+
+    def test_client_errors_and_generators_are_not_retried(self):
+        with mock.patch.object(self.dbclient.HTTPsession, 'request', return_value=FakeResponse(400)) as request:
+            self.assertRaises(InfluxdbAPICodeMismatchError, self.dbclient.write, 'unittestdb', self.points)
+        self.assertEqual(request.call_count, 1)
+
+        with mock.patch.object(self.dbclient.HTTPsession, 'request', side_effect=requests.Timeout()) as request:
+            self.assertRaises(InfluxdbAPIRequestError, self.dbclient.write, 'unittestdb', iter([self.points]))
+        self.assertEqual(request.call_count, 1)
+
+    def test_too_large_batch_is_split(self):
+        def request(data, **kwargs):
+            return FakeResponse(413) if data.count(b'\n') > 3 else FakeResponse(204)
+
+        with mock.patch.object(self.dbclient.HTTPsession, 'request', side_effect=request) as request:
+            self.assertEqual(self.dbclient.write('unittestdb', self.points).status_code, 204)
+        written = [call[1]['data'] for call in request.call_args_list if call[1]['data'].count(b'\n') <= 3]
+        self.assertEqual(b''.join(written), self.points)
+
+
+class InfluxDBClusterClientTest(unittest.TestCase):
+
+    def setUp(self):
+        self.points = Measurement(name='Tilt', fields={'X': -100.0}, timestamp=1388399803567000000).to_bytes()
+
+    def patch_nodes(self, cluster, down=(), failing=()):
+        writes = {}
+        for node in cluster.nodes:
+            def write(dbname, points, base_url=node.client.base_url, **kwargs):
+                if base_url in down:
+                    raise InfluxdbAPIConnectionError()
+                if base_url in failing:
+                    return FakeResponse(500, b'{"error": "timeout"}')
+                writes[base_url] = writes.get(base_url, 0) + 1
+                return FakeResponse(204)
+            node.client.write = write
+        return writes
+
+    def test_round_robin(self):
+        cluster = InfluxDBClusterClient(['10.0.0.1:8086', '10.0.0.2:8086', ('10.0.0.3', 8086)])
+        writes = self.patch_nodes(cluster)
+        for _ in range(9):
+            cluster.write('unittestdb', self.points)
+        self.assertEqual(list(writes.values()), [3, 3, 3])
+
+    def test_failed_node_is_taken_out_of_rotation(self):
+        cluster = InfluxDBClusterClient(['10.0.0.1:8086', '10.0.0.2:8086'], cooldown=60)
+        writes = self.patch_nodes(cluster, down=('http://10.0.0.1:8086', ))
+        for _ in range(4):
+            self.assertEqual(cluster.write('unittestdb', iter([self.points])).status_code, 204)
+        self.assertEqual(writes, {'http://10.0.0.2:8086': 4})
+        self.assertFalse(cluster.nodes[0].healthy)
+        self.assertTrue(cluster.nodes[1].healthy)
+
+    def test_node_responding_500_fails_over(self):
+        cluster = InfluxDBClusterClient(['10.0.0.1:8086', '10.0.0.2:8086'], cooldown=60)
+        writes = self.patch_nodes(cluster, failing=('http://10.0.0.1:8086', ))
+        for _ in range(4):
+            self.assertEqual(cluster.write('unittestdb', self.points).status_code, 204)
+        self.assertEqual(writes, {'http://10.0.0.2:8086': 4})
+        self.assertFalse(cluster.nodes[0].healthy)
+
+    def test_replication(self):
+        cluster = InfluxDBClusterClient(['10.0.0.1:8086', '10.0.0.2:8086', '10.0.0.3:8086'], replication=2,
+                                        strategy='least_outstanding')
+        writes = self.patch_nodes(cluster, down=('http://10.0.0.2:8086', ))
+        for _ in range(3):
+            cluster.write('unittestdb', self.points)
+        self.assertEqual(sum(writes.values()), 6)
+        self.assertNotIn('http://10.0.0.2:8086', writes)
+
+        writes = self.patch_nodes(cluster, down=[node.client.base_url for node in cluster.nodes])
+        self.assertRaises(InfluxdbAPIRequestError, cluster.write, 'unittestdb', self.points)
+
+    def test_close_stops_replication_threads(self):
+        with InfluxDBClusterClient(['10.0.0.1:8086', '10.0.0.2:8086'], replication=2) as cluster:
+            self.patch_nodes(cluster)
+            cluster.write('unittestdb', self.points)
+            executor = cluster._executor
+        self.assertIsNone(cluster._executor)
+        self.assertTrue(all(not thread.is_alive() for thread in executor._threads))
+
+
+class ClientMetricsTest(unittest.TestCase):
+
+    def test_histogram_percentiles(self):
+        histogram = Histogram()
+        for i in range(1, 1001):
+            histogram.record(i / 1000.0)
+        self.assertEqual(histogram.count, 1000)
+        self.assertAlmostEqual(histogram.mean, 0.5005)
+        self.assertTrue(0.5 <= histogram.percentile(50) <= 0.6)
+        self.assertTrue(0.99 <= histogram.percentile(99) <= 1.0)
+        self.assertEqual(histogram.percentile(100), 1.0)
+
+    def test_client_metrics(self):
+        metrics = ClientMetrics()
+        dbclient = InfluxDBClient(host='127.0.0.1', port=8086, metrics=metrics,
+                                  retry_policy=RetryPolicy(max_retries=1, backoff_base=0.01))
+        points = DummyPoints('Tilt', npoints=10, decimals=4).dump()
+
+        responses = [requests.ConnectionError(), FakeResponse(204), FakeResponse(content=b'{"results": []}'),
+                     requests.Timeout()]
+        with mock.patch.object(dbclient.HTTPsession, 'request', side_effect=responses):
+            dbclient.write('unittestdb', points)
+            dbclient.query('unittestdb', 'SELECT * FROM Tilt')
+            self.assertRaises(InfluxdbAPIRequestError, dbclient.write, 'unittestdb', iter([points]))
+
+        snapshot = metrics.snapshot()
+        self.assertEqual(snapshot['points'], 10)
+        write = snapshot['endpoints']['write']
+        self.assertEqual((write['requests'], write['retries'], write['bytes_sent']), (1, 1, len(points)))
+        self.assertEqual(write['errors'], {'InfluxdbAPITimeoutError': 1})  # generator is not retried
+        self.assertEqual(snapshot['endpoints']['query']['bytes_received'], 15)
+        self.assertEqual(snapshot['endpoints']['query']['latency']['count'], 1)
+
+    def test_points_written_of_every_payload_type(self):
+        points = DummyPoints('Tilt', npoints=100, decimals=4).dump()
+        payloads = {'bytes': lambda: points, 'memoryview': lambda: memoryview(points),
+                    'generator': lambda: iter(points.splitlines(keepends=True)), 'file': lambda: io.BytesIO(points)}
+        with FakeInfluxDBServer() as server:
+            for transport in ('requests', 'http.client'):
+                for kind, payload in payloads.items():
+                    for compress in (False, True):
+                        with self.subTest(transport=transport, payload=kind, compress=compress):
+                            server.reset()
+                            metrics = ClientMetrics()
+                            dbclient = InfluxDBClient(host=server.host, port=server.port, http_retries=0,
+                                                      metrics=metrics, transport=transport)
+                            dbclient.write('unittestdb', payload(), compress=compress)
+                            dbclient.close()
+                            self.assertEqual(server.points, 100)
+                            self.assertEqual(metrics.snapshot()['points'], server.points)
+
+
+class WriteSpoolTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.spool = WriteSpool(self.directory.name, segment_size=100, replay_interval=60)
+
+    def tearDown(self):
+        self.spool.stop()
+        self.directory.cleanup()
+
+    def test_replay_in_order_after_restart(self):
+        for i in range(10):
+            self.spool.append({'dbname': 'unittestdb'}, b'Tilt X=%d.000\n' % i)
+        self.spool.stop()
+
+        sent = []
+
+        def send(params, payload):
+            if len(sent) == 4:  # server goes down in the middle of replay
+                return False
+            sent.append(payload)
+            return True
+
+        spool = WriteSpool(self.directory.name, segment_size=100, replay_interval=60)
+        self.assertEqual(len(spool), 10)
+        self.assertEqual(spool.replay(send), 4)
+
+        spool = WriteSpool(self.directory.name, segment_size=100, replay_interval=60)
+        self.assertEqual(len(spool), 6)
+        self.assertEqual(spool.replay(lambda params, payload: sent.append(payload) or True), 6)
+        self.assertEqual(sent, [b'Tilt X=%d.000\n' % i for i in range(10)])
+        self.assertEqual(len(spool), 0)
+
+    def test_client_spools_failed_writes(self):
+        dbclient = InfluxDBClient(host='127.0.0.1', port=8086, http_retries=0, spool=self.spool)
+        point = Measurement(name='Tilt', fields={'X': -100.0}, timestamp=1388399803567000000)
+
+        with mock.patch.object(dbclient.HTTPsession, 'request', side_effect=requests.ConnectionError) as request:
+            self.assertIsNone(dbclient.write('unittestdb', point.to_bytes(), precision='n'))
+            self.assertIsNone(dbclient.write('unittestdb', iter([point.to_bytes()]), precision='n'))
+        self.assertEqual(request.call_count, 1)  # second write is spooled right away to keep the order
+        self.assertEqual(len(self.spool), 2)
+
+        with mock.patch.object(dbclient.HTTPsession, 'request', return_value=FakeResponse(204)) as request:
+            self.assertEqual(self.spool.replay(dbclient._replay_write), 2)
+            self.assertEqual(dbclient.write('unittestdb', point.to_bytes(), precision='n').status_code, 204)
+        self.assertEqual([call[1]['data'] for call in request.call_args_list], [point.to_bytes()] * 3)
+        self.assertEqual(request.call_args[1]['params']['precision'], 'n')
+
+    def test_streamed_batch_is_spooled_from_disk(self):
+        dbclient = InfluxDBClient(host='127.0.0.1', port=8086, http_retries=0, spool=self.spool)
+        lines = [b'Tilt X=%d.000\n' % i for i in range(10)]
+
+        def request(data, **kwargs):
+            next(data)  # connection drops after the first chunk is sent
+            raise requests.ConnectionError()
+
+        with mock.patch.object(dbclient.HTTPsession, 'request', side_effect=request):
+            self.assertIsNone(dbclient.write('unittestdb', iter(lines)))
+
+        def request(data, **kwargs):
+            sent.append(data if isinstance(data, bytes) else b''.join(data))
+            return FakeResponse(204)
+
+        sent = []
+        with mock.patch.object(dbclient.HTTPsession, 'request', side_effect=request) as mocked:
+            self.assertEqual(self.spool.replay(dbclient._replay_write), 1)
+            self.assertEqual(dbclient.write('unittestdb', io.BytesIO(b''.join(lines))).status_code, 204)
+        self.assertNotIsInstance(mocked.call_args[1]['data'], bytes)  # file is streamed, not read in memory
+        self.assertEqual(sent, [b''.join(lines)] * 2)
+        self.assertEqual(len(self.spool), 0)
+
+
+class LineSlicesTest(unittest.TestCase):
+
+    def test_lines_are_never_cut(self):
+        points = b'Tilt X=1.000\nTilt_long_series_name X=2.000\nTilt X=3.000\n'
+        slices = [points[start:end] for start, end in line_slices(points, 15)]
+        self.assertEqual(slices, [b'Tilt X=1.000\n', b'Tilt_long_series_name X=2.000\n', b'Tilt X=3.000\n'])
+        self.assertEqual(list(line_slices(points, 1000)), [(0, len(points))])
+
+
+class FakeInfluxDBServerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.server = FakeInfluxDBServer(store=True).start()
+        self.dbclient = InfluxDBClient(host=self.server.host, port=self.server.port, http_timeout=10,
+                                       retry_policy=RetryPolicy(max_retries=1, backoff_base=0.01))
+        self.dummies = DummyPoints('Tilt', npoints=1000, decimals=4)
+
+    def tearDown(self):
+        self.server.stop()
+
+    def test_write_modes(self):
+        points = self.dummies.dump()
+        self.assertEqual(self.dbclient.write('unittestdb', points, precision='n').status_code, 204)
+        self.dbclient.write('unittestdb', gzip.compress(points), precision='n', gzipped=True)
+        self.dbclient.write('unittestdb', iter(points.splitlines(keepends=True)), precision='n', compress=True)
+        self.assertEqual(self.server.points, 3000)
+        self.assertEqual([payload for dbname, payload in self.server.written], [points] * 3)
+
+    def test_write_file(self):
+        with tempfile.TemporaryDirectory() as directory:
+            self.dummies.dump(directory + '/dump.txt')
+            self.dummies.dump(directory + '/dump.gz', compress=True)
+            with open(directory + '/dump.txt', 'rb') as f:
+                points = f.read()
+
+            self.assertTrue(self.dbclient.write_file('unittestdb', directory + '/dump.txt', slice_size=4000) > 1)
+            slices = [payload for dbname, payload in self.server.written]
+            self.assertTrue(all(payload.endswith(b'\n') for payload in slices))
+            self.assertEqual(b''.join(slices), points)
+
+            self.server.reset()
+            self.assertEqual(self.dbclient.write_file('unittestdb', directory + '/dump.gz', slice_size=4000), 1)
+            self.assertEqual(self.server.points, 1000)
+
+    def test_query_and_injected_failure(self):
+        self.server.query_results['SELECT * FROM Tilt'] = {'series': [{'name': 'Tilt', 'columns': ['time', 'T'],
+                                                                       'values': [[1, 30]]}]}
+        self.server.fail_next(503)
+        q = self.dbclient.query('unittestdb', 'SELECT * FROM Tilt')
+        self.assertEqual(q['results'][0]['series'][0]['values'][0][1], 30)
+        self.assertEqual(self.server.requests, 1)  # the first one has failed and was retried
+
+    def test_benchmark_run(self):
+        results = benchmarks.run(npoints=2000, batch_size=500, repeat=1, modes=['container', 'compress'])
+        json.dumps(results)
+        self.assertEqual(sorted(results['modes']), ['compress', 'container'])
+        for result in results['modes'].values():
+            self.assertEqual(result['points'], 2000)
+            self.assertTrue(result['points_per_second'] > 0)
+        self.assertEqual(benchmarks.compare(results, results), [])
+
+
+class LoadGeneratorTest(unittest.TestCase):
+
+    @unittest.skipIf(np is None, 'numpy is not installed')
+    def test_stages_against_fake_server(self):
+        stages = parse_stages('warmup:0.2:5000,spike:0.2:20000')
+        self.assertEqual([(stage.name, stage.seconds, stage.rate) for stage in stages],
+                         [('warmup', 0.2, 5000), ('spike', 0.2, 20000)])
+        with FakeInfluxDBServer() as server:
+            client = InfluxDBClient(host=server.host, port=server.port, http_retries=0)
+            results = LoadGenerator(client, 'loaddb', stages, batch_size=500, workers=2, seed=1).run()
+        self.assertEqual([result.points for result in results], [1000, 4000])
+        self.assertEqual(server.points, 5000)
+        self.assertEqual(results[1].snapshot()['latency']['count'], 8)
+
+    def test_latency_includes_waiting_for_sender(self):
+        def slow_write(**kwargs):
+            sleep(0.05)
+        client = mock.Mock(write=mock.Mock(side_effect=slow_write))
+        # a batch every 10 ms, a single sender takes 50 ms: the backlog grows
+        result = LoadGenerator(client, 'loaddb', [Stage('steady', 0.1, 1000)], batch_size=10, workers=1,
+                               source=iter(lambda: b'Tilt X=1.0\n', None)).run()[0]
+        self.assertEqual(result.batches, 10)
+        self.assertLess(result.service_time.max, 0.1)
+        self.assertGreater(result.latency.max, 0.3)
+
+    def test_failed_batches_and_exhausted_source(self):
+        responses = iter([FakeResponse(204), FakeResponse(500), FakeResponse(204)])
+        client = mock.Mock(write=mock.Mock(side_effect=lambda **kwargs: next(responses)))
+        source = iter([b'Tilt X=1.0\nTilt X=2.0\n', b'Tilt X=3.0\n', b'Tilt X=4.0\nTilt X=5.0'])
+        results = LoadGenerator(client, 'loaddb', [Stage('steady', 0.1, 1000), Stage('spike', 0.1, 1000)],
+                                batch_size=10, workers=1, source=source).run()
+        self.assertEqual(len(results), 1)  # source ran out in the first stage
+        self.assertEqual((results[0].batches, results[0].errors, results[0].points), (3, 1, 4))
+
+
+class QueryBatchTest(unittest.TestCase):
+
+    def setUp(self):
+        self.server = FakeInfluxDBServer().start()
+        self.client = InfluxDBClient(host=self.server.host, port=self.server.port, http_retries=0)
+        self.statements = ["SELECT last(X) FROM Tilt WHERE sensor = 'Tilt_%d'" % i for i in range(50)]
+        for i, statement in enumerate(self.statements):
+            self.server.query_results[statement] = {'series': [{'name': 'Tilt', 'columns': ['time', 'last'],
+                                                                'values': [[0, i]]}]}
+
+    def tearDown(self):
+        self.server.stop()
+
+    def test_statements_are_packed_and_demultiplexed(self):
+        batch = QueryBatch(self.client, 'batchdb', max_bytes=1024)
+        indexes = [batch.add(statement) for statement in self.statements]
+        results = batch.execute()
+        self.assertEqual(len(self.server.queries), 4)  # ~70 bytes per urlencoded statement
+        self.assertEqual(sum(len(statements) for statements in self.server.queries), 50)
+        self.assertEqual([results[i]['series'][0]['values'][0][1] for i in indexes], list(range(50)))
+        self.assertEqual([result['statement_id'] for result in results], list(range(50)))
+        self.assertEqual(len(batch), 0)
+
+    def test_failed_request_is_retried_per_statement(self):
+        self.server.fail_next(400)
+        results = self.client.query_many('batchdb', self.statements[:3] + ['SELECT bad'])
+        self.assertEqual(len(self.server.queries), 4)
+        self.assertEqual([result['series'][0]['values'][0][1] for result in results[:3]], [0, 1, 2])
+        self.assertNotIn('series', results[3])
+
+    def test_not_executed_statements_are_sent_again(self):
+        series = {'series': [{'name': 'Tilt', 'columns': ['time', 'last'], 'values': [[0, 1]]}]}
+        responses = [FakeResponse(content=json.dumps({'results': [dict(series, statement_id=0),
+                                                                  {'statement_id': 1, 'error': 'boom'},
+                                                                  {'statement_id': 2, 'error': 'not executed'}]
+                                                      }).encode()),
+                     FakeResponse(content=json.dumps({'results': [dict(series, statement_id=0)]}).encode())]
+        dbclient = InfluxDBClient(host='127.0.0.1', port=8086)
+        with mock.patch.object(dbclient.HTTPsession, 'request', side_effect=responses) as request:
+            results = dbclient.query_many('batchdb', self.statements[:3])
+        self.assertEqual(request.call_count, 2)
+        self.assertEqual(request.call_args[1]['data'], 'q=' + quote_plus(self.statements[2]))
+        self.assertEqual([result['statement_id'] for result in results], [0, 1, 2])
+        self.assertEqual(results[1]['error'], 'boom')
+        self.assertEqual(results[2]['series'], series['series'])
+
+
+class QueryCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.server = FakeInfluxDBServer().start()
+        self.server.query_results['SELECT X FROM Tilt'] = {'series': [{'name': 'Tilt', 'columns': ['time', 'X'],
+                                                                      'values': [[1, 2.0]]}]}
+        self.cache = QueryCache(ttl=60)
+        self.client = InfluxDBClient(host=self.server.host, port=self.server.port, http_retries=0,
+                                     query_cache=self.cache)
+
+    def tearDown(self):
+        self.server.stop()
+
+    def test_write_aware_invalidation(self):
+        first = self.client.query('cachedb', 'SELECT X FROM Tilt')
+        self.assertIs(self.client.query('cachedb', ' SELECT  X\nFROM Tilt;'), first)
+        self.client.write('cachedb', Measurement('Other', {'X': 1.0}).to_bytes())
+        self.client.write('otherdb', Measurement('Tilt', {'X': 1.0}).to_bytes())
+        self.assertIs(self.client.query('cachedb', 'SELECT X FROM Tilt'), first)
+        self.assertEqual(len(self.server.queries), 1)
+
+        self.client.write('cachedb', Measurement('Other', {'X': 1.0}).to_bytes() +
+                          Measurement('Tilt', {'X': 1.0}).to_bytes())
+        self.assertIsNot(self.client.query('cachedb', 'SELECT X FROM Tilt'), first)
+        self.client.query('cachedb', 'DELETE FROM Tilt')
+        self.client.query('cachedb', 'SELECT X FROM Tilt')
+        self.assertEqual(len(self.server.queries), 4)
+        self.assertEqual((self.cache.hits, self.cache.misses), (2, 3))
+
+    def test_memoryview_writes_and_show_databases(self):
+        first = self.client.query('cachedb', 'SELECT X FROM Tilt')
+        self.client.write('cachedb', memoryview(Measurement('Other', {'X': 1.0}).to_bytes()))
+        self.assertIs(self.client.query('cachedb', 'SELECT X FROM Tilt'), first)
+        self.client.write('cachedb', memoryview(Measurement('Other', {'X': 1.0}).to_bytes() +
+                                                Measurement('Tilt', {'X': 1.0}, {'sensor': 'Tilt_1'}).to_bytes()))
+        self.assertIsNot(self.client.query('cachedb', 'SELECT X FROM Tilt'), first)
+
+        databases = self.client.query('cachedb', 'SHOW DATABASES')
+        self.assertIs(self.client.query('cachedb', 'SHOW DATABASES'), databases)
+        self.client.create_database('newdb')
+        databases = self.client.query('cachedb', 'SHOW DATABASES')
+        self.client.drop_database('newdb')
+        self.assertIsNot(self.client.query('cachedb', 'SHOW DATABASES'), databases)
+
+    def test_ttl_and_lru_eviction(self):
+        self.client.query('cachedb', 'SELECT X FROM Tilt', cache_ttl=0.05)
+        sleep(0.1)
+        self.client.query('cachedb', 'SELECT X FROM Tilt')
+        self.assertEqual(len(self.server.queries), 2)
+
+        self.cache.max_bytes = self.cache.nbytes * 2
+        self.client.query('cachedb', 'SELECT X FROM Tilt', epoch='s')
+        self.client.query('cachedb', 'SELECT X FROM Tilt')  # most recently used
+        self.client.query('cachedb', 'SELECT X FROM Tilt', epoch='ms')
+        self.assertEqual([key[2] for key in self.cache.entries], [None, 'ms'])
+
+
+class WindowAggregatorTest(unittest.TestCase):
+
+    def setUp(self):
+        self.start = 1388399800000000000
+        self.writer = BatchWriter(FakeClient(), 'aggdb', max_age=None)
+        self.aggregator = WindowAggregator(self.writer, window=10.0, aggregates=('mean', 'max', 'count'),
+                                           allowed_lateness=5.0)
+
+    def tilt(self, seconds, x, sensor='Tilt_1'):
+        return Measurement('Tilt', {'X': x}, {'sensor': sensor}, self.start + int(seconds * 10**9))
+
+    def test_windows_late_points_and_close(self):
+        self.aggregator.append(self.tilt(1, 1.0), self.tilt(2, 3.0), self.tilt(4, 5.0, 'Tilt_2'))
+        self.aggregator.append(self.tilt(12, 2.0), self.tilt(9, 5.0))  # late, but within allowed lateness
+        self.assertEqual(len(self.writer), 0)
+        self.aggregator.append(self.tilt(15, 4.0))  # watermark of Tilt_1 passes 10 + 5 seconds
+        self.assertEqual(len(self.writer), 1)  # window of Tilt_2 waits for its own newer points
+        self.aggregator.append(self.tilt(3, 100.0))  # its window is emitted already
+        self.assertEqual(self.aggregator.late, 1)
+
+        self.aggregator.close()
+        self.assertTrue(self.writer.closed)
+        self.assertEqual(self.writer.client.writes[0][1].decode(),
+                         'Tilt,sensor=Tilt_1 mean_X=3.000,max_X=5.000,count_X=3i 1388399800000000000\n'
+                         'Tilt,sensor=Tilt_2 mean_X=5.000,max_X=5.000,count_X=1i 1388399800000000000\n'
+                         'Tilt,sensor=Tilt_1 mean_X=3.000,max_X=4.000,count_X=2i 1388399810000000000\n')
+
+    def test_flush_during_backfill_loses_no_points(self):
+        for i in range(60):
+            # Tilt_2 lags 10 seconds behind Tilt_1
+            self.aggregator.append(self.tilt(i, 1.0), self.tilt(i - 10, 1.0, 'Tilt_2'))
+            if i % 10 == 9:
+                self.aggregator.flush()
+        self.aggregator.close()
+        self.assertEqual(self.aggregator.late, 0)
+        lines = b''.join(write[1] for write in self.writer.client.writes).decode().splitlines()
+        self.assertEqual(sum(int(line.split('count_X=')[1].split('i')[0]) for line in lines), 120)
+
+
+class DeadbandFilterTest(unittest.TestCase):
+
+    def setUp(self):
+        self.sink = mock.Mock()
+        self.filter = DeadbandFilter(self.sink, deadband={'T': 0.5}, relative={'X': 0.1}, heartbeat=60)
+
+    def passed(self):
+        return [(point.fields, point.timestamp) for call in self.sink.append.call_args_list for point in call[0]]
+
+    def test_deadband_and_heartbeat(self):
+        seconds = 10**9
+        start = 1388399800 * seconds
+        samples = [{'T': 20.0, 'X': 100.0},
+                   {'T': 20.4, 'X': 105.0},  # within deadbands
+                   {'T': 20.6, 'X': 100.0},  # T changed by more than 0.5
+                   {'T': 20.6, 'X': 89.0},  # X changed by more than 10%
+                   {'T': 20.6, 'X': 89.0}]
+        self.filter.append(*[Measurement('Tilt', fields, {'sensor': 'Tilt_1'}, start + i * seconds)
+                             for i, fields in enumerate(samples)])
+        self.filter.append(Measurement('Tilt', {'T': 20.6, 'X': 89.0}, {'sensor': 'Tilt_1'}, start + 63 * seconds))
+        self.filter.append(Measurement('Tilt', {'T': 20.6, 'X': 89.0}, {'sensor': 'Tilt_1'}, start + 64 * seconds))
+        self.assertEqual([(timestamp - start) // seconds for fields, timestamp in self.passed()], [0, 2, 3, 63])
+
+        self.filter.close()  # last dropped point is sent
+        self.assertEqual(self.passed()[-1], ({'T': 20.6, 'X': 89.0}, start + 64 * seconds))
+        self.assertEqual((self.filter.points, self.filter.passed), (7, 5))
+        self.sink.close.assert_called_once_with()
+
+
+class TransportTest(unittest.TestCase):
+
+    def test_http_client_transport(self):
+        points = DummyPoints('Tilt', npoints=1000, decimals=4).dump()
+        with FakeInfluxDBServer(store=True) as server:
+            server.query_results['SELECT X FROM Tilt'] = {'series': [{'name': 'Tilt', 'columns': ['time', 'X'],
+                                                                      'values': [[1, 2.0]]}]}
+            dbclient = InfluxDBClient(host=server.host, port=server.port, http_retries=0, transport='http.client',
+                                      pool_size=2)
+            self.assertEqual(dbclient.write('unittestdb', points, precision='n').status_code, 204)
+            dbclient.write('unittestdb', gzip.compress(points), precision='n', gzipped=True)
+            dbclient.write('unittestdb', iter(points.splitlines(keepends=True)), precision='n', compress=True)
+            dbclient.write('unittestdb', io.BytesIO(points), precision='n')
+            self.assertEqual([payload for dbname, payload in server.written], [points] * 4)
+            self.assertEqual(dbclient.query('unittestdb', 'SELECT X FROM Tilt')['results'][0]['series'][0]['values'],
+                             [[1, 2.0]])
+            self.assertEqual([series['name'] for series in dbclient.query_chunked('unittestdb', 'SELECT X FROM Tilt')],
+                             ['Tilt'])
+            self.assertEqual(len(dbclient.transport._idle[('http', server.host, server.port)]), 1)  # kept alive
+
+            server.fail_next(400)
+            self.assertRaises(InfluxdbAPICodeMismatchError, dbclient.write, 'unittestdb', points)
+            dbclient.close()
+        self.assertRaises(InfluxdbAPIConnectionError, dbclient.write, 'unittestdb', points)
+
+    def test_in_memory_transport(self):
+        class MemoryTransport(Transport):
+            def __init__(self):
+                self.requests = []
+
+            def request(self, method, url, params=None, data=None, headers=None, timeout=None, stream=False):
+                self.requests.append((method, url, params, data))
+                return FakeResponse(204)
+
+        transport = MemoryTransport()
+        dbclient = InfluxDBClient(host='influxdb', port=8086, transport=transport)
+        dbclient.write('unittestdb', b'Tilt X=1.0\n')
+        self.assertEqual(transport.requests, [('POST', 'http://influxdb:8086/write',
+                                               {'db': 'unittestdb', 'u': None, 'p': None, 'rp': None,
+                                                'precision': None, 'consistency': None}, b'Tilt X=1.0\n')])
+
+
+@unittest.skipIf(np is None, 'numpy is not installed')
+class ColumnarQueryTest(unittest.TestCase):
+
+    def test_query_columnar(self):
+        dbclient = InfluxDBClient(host='127.0.0.1', port=8086)
+        result = {'results': [{'series': [{'name': 'Tilt', 'columns': ['time', 'X', 'T', 'sensor'],
+                                           'values': [[1388399803567000000, -100, 30.5, 'a'],
+                                                      [1388399803568000000, None, 31.5, 'b']]}]}]}
+        response = FakeResponse(content=json.dumps(result).encode())
+
+        with mock.patch.object(dbclient.HTTPsession, 'request', return_value=response) as request:
+            q = dbclient.query('unittestdb', 'SELECT * FROM Tilt', columnar=True)
+
+        self.assertEqual(request.call_args[1]['params']['epoch'], 'n')
+        columns = q['results'][0]['series'][0]['values']
+        self.assertEqual(columns['time'].dtype, np.int64)
+        self.assertEqual(columns['time'].tolist(), [1388399803567000000, 1388399803568000000])
+        self.assertEqual(columns['T'].tolist(), [30.5, 31.5])
+        self.assertEqual(columns['X'][0], -100)
+        self.assertTrue(np.isnan(columns['X'][1]))
+        self.assertEqual(columns['sensor'].tolist(), ['a', 'b'])
+
+
+@unittest.skipIf(np is None, 'numpy is not installed')
+class EncodeColumnsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.timestamps = np.arange(1000, dtype=np.int64) * 600000000000 + 1388399803567000000
+        self.x = np.random.random(1000) * -720.0
+        self.t = np.random.random(1000) * 30.0
+        self.sensors = np.array(['Tilt_%d' % (i % 7) for i in range(1000)])
+
+    def test_byte_identical_to_measurements(self):
+        container = Container(*[Measurement(name='Tilt', fields={'X': x, 'T': t}, tags={'sensor': s, 'site': 'L1'},
+                                            timestamp=ts)
+                                for x, t, s, ts in zip(self.x.tolist(), self.t.tolist(), self.sensors.tolist(),
+                                                       self.timestamps.tolist())])
+        encoded = encode_columns('Tilt', {'X': self.x, 'T': self.t}, self.timestamps,
+                                 tags={'sensor': self.sensors, 'site': 'L1'}, decimals=4, chunk_size=300)
+        self.assertEqual(encoded, bytes(container.dump(decimals=4)))
+
+    def test_typed_columns(self):
+        counts = np.arange(1000)
+        flags = counts % 3 == 0
+        notes = np.array(['note "%d", x=1' % (i % 5) for i in range(1000)])
+        points = [Measurement(name='Tilt', fields={'N': n, 'F': f, 'S': s, 'X': x}, tags={'sensor': sensor},
+                              timestamp=ts)
+                  for n, f, s, x, sensor, ts in zip(counts.tolist(), flags.tolist(), notes.tolist(), self.x.tolist(),
+                                                    self.sensors.tolist(), self.timestamps.tolist())]
+        encoded = encode_columns('Tilt', {'N': counts, 'F': flags, 'S': notes, 'X': self.x}, self.timestamps,
+                                 tags={'sensor': self.sensors})
+        self.assertEqual(encoded, b''.join(point.to_bytes() for point in points))
+        self.assertIn(b'N=0i,F=true,S="note \\"0\\", x=1",X=', encoded)
+
+    def test_object_column_is_encoded_per_value(self):
+        values = np.array([1.5, 2, True, 'on', np.int64(3)], dtype=object)
+        points = [Measurement(name='Tilt', fields={'X': x}, timestamp=ts)
+                  for x, ts in zip(values.tolist(), self.timestamps.tolist())]
+        encoded = encode_columns('Tilt', {'X': values}, self.timestamps[:5])
+        self.assertEqual(encoded, b''.join(point.to_bytes() for point in points))
+        self.assertEqual([line.split(b' ')[1] for line in encoded.splitlines()],
+                         [b'X=1.500', b'X=2i', b'X=true', b'X="on"', b'X=3i'])
+
+    def test_columns_of_different_lengths(self):
+        with self.assertRaises(ValueError) as raised:
+            encode_columns('Tilt', {'X': self.x, 'T': self.t[:999]}, self.timestamps)
+        self.assertIn('field <T>', str(raised.exception))
+        self.assertRaisesRegex(ValueError, 'timestamps', encode_columns, 'Tilt', {'X': self.x}, self.timestamps[:10])
+        self.assertRaisesRegex(ValueError, 'tag <sensor>', encode_columns, 'Tilt', {'X': self.x},
+                               tags={'sensor': self.sensors[:10]})
+
+    def test_scalars_make_a_single_point(self):
+        self.assertEqual(encode_columns('Tilt', {'X': 1.5, 'N': 2}, tags={'sensor': 'Tilt_1'}),
+                         Measurement(name='Tilt', fields={'X': 1.5, 'N': 2}, tags={'sensor': 'Tilt_1'}).to_bytes())
+
+    def test_missing_timestamps(self):
+        self.timestamps[3] = 0
+        points = [Measurement(name='Tilt', fields={'X': x}, timestamp=ts)
+                  for x, ts in zip(self.x.tolist(), self.timestamps.tolist())]
+        self.assertEqual(encode_columns('Tilt', {'X': self.x}, self.timestamps),
+                         b''.join(point.to_bytes() for point in points))
 
 
 
@@ -0,0 +1,173 @@
+__author__ = 'Yury A. Kolotovichev'
+
+import threading
+import logging
+from time import time
+from Influxdb.exceptions import InfluxdbAPICodeMismatchError, InfluxdbAPIRequestError
+
+
+class BatchWriter:
+    """
+    Buffered writer on top of InfluxDBClient.write. Collects points and sends them
+    in a single POST when a point count, byte size or maximum age is reached
+    """
+
+    def __init__(self, client, dbname, batch_size=5000, batch_bytes=4*1024*1024, max_age=1.0,
+                 decimals=3, retention_policy=None, precision='n', consistency=None,
+                 max_retained_bytes=64*1024*1024):
+        """
+        :param client: InfluxDBClient instance
+        :param dbname: database name
+        :param batch_size: flush when number of buffered points reaches this value
+        :param batch_bytes: flush when buffered line protocol reaches this size (bytes)
+        :param max_age: flush when the oldest buffered point is older than this (seconds), None disables
+        :param decimals: number of decimals in line protocol representation
+        :param max_retained_bytes: limit of the buffer holding batches kept for retry after failed writes,
+                                   a failed batch that doesn't fit is dropped
+        :return:
+        """
+        self.client = client
+        self.dbname = dbname
+        self.batch_size = batch_size
+        self.batch_bytes = batch_bytes
+        self.max_age = max_age
+        self.decimals = decimals
+        self.retention_policy = retention_policy
+        self.precision = precision
+        self.consistency = consistency
+        self.max_retained_bytes = max_retained_bytes
+
+        self.buffer = bytearray()
+        self.npoints = 0
+        self.first_append = None  # time of the oldest buffered point
+
+        self.closed = False
+        self._lock = threading.Lock()  # guards buffer
+        self._send_lock = threading.Lock()  # keeps batches in order
+        self._wakeup = threading.Event()
+
+        self._flusher = None
+        if max_age:
+            self._flusher = threading.Thread(target=self._flush_loop, name='BatchWriter-flusher', daemon=True)
+            self._flusher.start()
+
+    def append(self, *points):
+        """
+        Adds points to the buffer. Points are Measurement-like objects (with to_bytes) or line protocol bytes
+        """
+
+        if self.closed:
+            raise ValueError('BatchWriter is closed')
+
+        with self._lock:
+            if not self.npoints:
+                self.first_append = time()
+            for point in points:
+                if isinstance(point, (bytes, bytearray)):
+                    self.buffer.extend(point)
+                else:
+                    self.buffer.extend(point.to_bytes(decimals=self.decimals))
+                self.npoints += 1
+            full = self.npoints >= self.batch_size or len(self.buffer) >= self.batch_bytes
+
+        if full:
+            self.flush()
+
+    def _swap(self):
+        with self._lock:
+            batch, npoints, first_append = self.buffer, self.npoints, self.first_append
+            self.buffer = bytearray()
+            self.npoints = 0
+            self.first_append = None
+        return batch, npoints, first_append
+
+    def _restore(self, batch, npoints, first_append):
+        """
+        Puts a batch that failed to be sent back in front of the points appended meanwhile
+        """
+
+        with self._lock:
+            if len(batch) + len(self.buffer) > self.max_retained_bytes:
+                logging.error('BatchWriter: buffer is over %d bytes, failed batch of %d points dropped' %
+                              (self.max_retained_bytes, npoints))
+                return
+            self.buffer[0:0] = batch
+            self.npoints += npoints
+            self.first_append = first_append
+
+    def flush(self):
+        """
+        Sends buffered points in a single POST. If the server is unreachable or fails (5xx), points stay
+        in the buffer and the error is raised. Batch rejected by the server (4xx) is dropped and the error is raised
+        :return: number of points sent
+        """
+
+        with self._send_lock:
+            batch, npoints, first_append = self._swap()
+            if npoints:
+                try:
+                    r = self.client.write(dbname=self.dbname, points=bytes(batch),
+                                          retention_policy=self.retention_policy,
+                                          precision=self.precision,
+                                          consistency=self.consistency)
+                    # InfluxDBClient.write returns 500 instead of raising
+                    if r is not None and r.status_code >= 500:
+                        raise InfluxdbAPICodeMismatchError(r.text, r.status_code, (204, ))
+                except InfluxdbAPICodeMismatchError as err:
+                    if err.code_received < 500:  # retrying a malformed batch would fail forever
+                        logging.error('BatchWriter: batch of %d points rejected and dropped' % npoints)
+                    else:
+                        self._restore(batch, npoints, first_append)
+                    raise
+                except InfluxdbAPIRequestError:
+                    self._restore(batch, npoints, first_append)
+                    raise
+                logging.debug('BatchWriter: %d points (%d bytes) flushed' % (npoints, len(batch)))
+        return npoints
+
+    def _flush_loop(self):
+        while not self.closed:
+            with self._lock:
+                first_append = self.first_append
+            if first_append is None:
+                timeout = self.max_age
+            else:
+                timeout = first_append + self.max_age - time()
+
+            if timeout > 0:
+                self._wakeup.wait(timeout)
+                self._wakeup.clear()
+                continue
+
+            try:
+                self.flush()
+            except (InfluxdbAPIRequestError, InfluxdbAPICodeMismatchError) as err:
+                logging.error('BatchWriter: background flush failed: %s' % err)
+                self._wakeup.wait(self.max_age)  # points are kept, retry after max_age
+                self._wakeup.clear()
+
+    def close(self):
+        """
+        Stops background flushing and sends remaining points. If the write fails, the error is raised
+        and points are kept as flush() keeps them, flush() may be called again
+        """
+
+        if self.closed:
+            return
+        self.closed = True
+        if self._flusher is not None:
+            self._wakeup.set()
+            self._flusher.join()
+        self.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def __len__(self):
+        return self.npoints
+
+    def __repr__(self):
+        return 'BatchWriter: %d points buffered for <%s>' % (self.npoints, self.dbname)